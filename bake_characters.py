@@ -0,0 +1,19 @@
+"""
+    Import every character in the character metadata once and save it to the
+    baked character library in the cache directory, from where
+    GenerateCharacter appends it instead of importing the fbx. Already baked
+    characters are skipped. Run with `make run-bake_characters`.
+"""
+import bpy
+
+from blenderset.character import GenerateCharacter
+
+bpy.ops.wm.open_mainfile(filepath="blank.blend")
+characters = list(GenerateCharacter(bpy.context).model_data.values())
+
+for character in characters:
+    bpy.ops.wm.open_mainfile(filepath="blank.blend")
+    gen = GenerateCharacter(bpy.context)
+    if gen.baked_character_path(character).exists():
+        continue
+    print("Baked", gen.bake_character(character))
@@ -0,0 +1,12 @@
+"""
+    Render all jersey numbers and player names used by GenerateSoccerClothes
+    into the asset cache, so that creating soccer players never has to render
+    them. Run with `make run-bake_soccer_textures`.
+"""
+import bpy
+
+from blenderset.bedlam import GenerateSoccerClothes
+
+bpy.ops.wm.open_mainfile(filepath="blank.blend")
+manifest = GenerateSoccerClothes(bpy.context).bake_numbers_and_names()
+print(f"Baked {len(manifest['number'])} numbers and {len(manifest['name'])} names")
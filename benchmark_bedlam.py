@@ -0,0 +1,53 @@
+"""
+    Measures the time it takes to add one BEDLAM character at a time to a
+    scene that already contains 0, 1, 2, ... characters. The per character cost
+    should stay flat as the scene grows. The part of it spent in
+    `reset_pose_and_shape`, which `create()` calls for each character, is
+    reported separately. Run with `make run-benchmark_bedlam`.
+"""
+import json
+import sys
+from time import time
+
+import bpy
+import numpy as np
+
+import blenderset.bedlam
+from blenderset.bedlam import GenerateBedlam, Positioner, reset_pose_and_shape
+
+nbr_of_characters = 50
+np.random.seed(42)
+
+
+class WidePositioner(Positioner):
+    "Spread the characters out enough to never run out of free positions."
+    def random_position(self, roi, max_dist=2):
+        return np.random.uniform(-50, 50, 2)
+
+
+reset_times = []
+
+
+def timed_reset_pose_and_shape(armature):
+    t0 = time()
+    reset_pose_and_shape(armature)
+    reset_times.append(time() - t0)
+
+
+# Time the calls made by GenerateBedlam.create() instead of adding another one
+blenderset.bedlam.reset_pose_and_shape = timed_reset_pose_and_shape
+
+bpy.ops.wm.open_mainfile(filepath="blank.blend")
+gen = GenerateBedlam(bpy.context, nbr_of_bedlams=1, positioner=WidePositioner())
+
+timing = []
+for i in range(nbr_of_characters):
+    reset_times.clear()
+    t0 = time()
+    gen.create()
+    t1 = time()
+    timing.append(dict(characters=i + 1, create=t1 - t0, reset_pose_and_shape=sum(reset_times)))
+    print("Timing", timing[-1])
+
+json.dump(timing, sys.stdout, indent=4)
+print()
@@ -0,0 +1,142 @@
+"""
+    Measures what the render settings cost and buy. A small deterministic
+    scene is built from the example background 32180_0.jpg and a few
+    primitives, and is rendered on the CPU with every combination of the
+    samples, denoising and bounces below. For each render the wall time, the
+    peak RSS of the process during the render and the PSNR and SSIM against
+    a high sample reference are recorded. The peak RSS is reset before each
+    render through /proc/self/clear_refs, where that is not supported it is
+    the peak of the process so far. The report is printed and saved as
+    `renders/benchmark_render/<commit>.json` so that it can be compared
+    across commits. Run with `make run-benchmark_render`, with `assets_dir`
+    and `metadata_dir` in the config pointing to example-assets and
+    example-metadata.
+"""
+import itertools
+import json
+import resource
+import subprocess
+import sys
+from pathlib import Path
+
+import bpy
+import numpy as np
+from shapely.geometry import Point, Polygon
+
+from blenderset.background import GenerateBackgroundAndCamera
+from blenderset.render import Renderer
+from blenderset.utils.exr import ExrFile
+from blenderset.utils.metrics import psnr, ssim, to_display
+
+root = Path("renders/benchmark_render")
+resolution = 320  # Width in pixels
+reference_samples = 2048
+samples = [16, 64, 256]
+denoising = [False, True]
+bounces = [2, 8]
+nbr_of_objects = 8
+
+
+def create_scene():
+    np.random.seed(42)
+    bpy.ops.wm.open_mainfile(filepath="blank.blend")
+    gen = GenerateBackgroundAndCamera(bpy.context, background_name="32180_0.jpg")
+    gen.create()
+
+    roi = Polygon(gen.get_all_proprty_values("blenderset.walkable_roi")[0])
+    x0, y0, x1, y1 = roi.bounds
+    for i in range(nbr_of_objects):
+        while True:
+            x, y = np.random.uniform((x0, y0), (x1, y1))
+            if roi.contains(Point(x, y)):
+                break
+        if i % 2:
+            bpy.ops.mesh.primitive_uv_sphere_add(radius=0.5, location=(x, y, 0.5))
+        else:
+            bpy.ops.mesh.primitive_cube_add(size=1, location=(x, y, 0.5))
+        material = bpy.data.materials.new(f"Benchmark{i}")
+        material.use_nodes = True
+        bsdf = material.node_tree.nodes["Principled BSDF"]
+        bsdf.inputs["Base Color"].default_value = list(np.random.uniform(0, 1, 3)) + [1]
+        bsdf.inputs["Roughness"].default_value = i / nbr_of_objects
+        bsdf.inputs["Metallic"].default_value = i % 3 == 0
+        bpy.context.object.data.materials.append(material)
+
+    bpy.ops.object.light_add(type="SUN", rotation=(0.6, 0.2, 0.8))
+    bpy.context.object.data.energy = 5
+
+    render = bpy.context.scene.render
+    render.resolution_percentage = max(1, round(100 * resolution / render.resolution_x))
+    return gen
+
+
+def reset_peak_rss():
+    "Reset the peak RSS of the process to its current RSS (Linux only)."
+    try:
+        with open("/proc/self/clear_refs", "w") as fd:
+            fd.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    "Peak RSS since the last `reset_peak_rss()`, or since the process started."
+    try:
+        with open("/proc/self/status") as fd:
+            for line in fd:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def render(gen, name, **settings):
+    renderer = Renderer(bpy.context, root, save_exr=True)
+    renderer.device = "CPU"
+    for key, value in settings.items():
+        setattr(renderer, key, value)
+    reset_peak_rss()
+    out = renderer.render(gen, name)
+    peak_rss = peak_rss_mb()
+    img = to_display(ExrFile(out / "layers.exr").get_rgb_image())
+    return dict(settings, time=renderer.render_time, peak_rss_mb=peak_rss), img
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    gen = create_scene()
+    reference_result, reference = render(
+        gen, "reference", samples=reference_samples, use_denoising=False, adaptive_threshold=0.001
+    )
+    commit = git_commit()
+    report = dict(
+        commit=commit,
+        blender=bpy.app.version_string,
+        resolution=[
+            bpy.context.scene.render.resolution_x * bpy.context.scene.render.resolution_percentage // 100,
+            bpy.context.scene.render.resolution_y * bpy.context.scene.render.resolution_percentage // 100,
+        ],
+        reference=reference_result,
+        results=[],
+    )
+    for s, d, b in itertools.product(samples, denoising, bounces):
+        result, img = render(gen, f"s{s}_d{int(d)}_b{b}", samples=s, use_denoising=d, bounces=b)
+        result.update(psnr=psnr(img, reference), ssim=ssim(img, reference))
+        report["results"].append(result)
+        print("Result", result)
+
+    with open(root / f"{commit}.json", "w") as fd:
+        json.dump(report, fd, indent=4)
+    json.dump(report, sys.stdout, indent=4)
+    print()
+
+
+if __name__ == "__main__":
+    main()
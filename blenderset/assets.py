@@ -1,10 +1,11 @@
-import json
 from pathlib import Path
 from shapely.geometry import MultiPolygon, Polygon, Point
 import numpy as np
 
 import bpy
 
+from blenderset.catalog import get_catalog
+
 
 class AssetGenerator:
     override_roi = None
@@ -13,12 +14,9 @@ class AssetGenerator:
         self.context = context
         self.created_objects = []
         self.bvh_tree_cache = {}
+        self.catalog = get_catalog()
 
-        config_file = Path.home() / '.config' / 'blenderset' / 'config.json'
-        if config_file.exists():
-            self.config = json.load(config_file.open())
-        else:
-            self.config = {}
+        self.config = self.catalog.config
         if 'assets_dir' in self.config:
             self.root = Path(self.config.get('assets_dir'))
         else:
@@ -27,6 +25,10 @@ class AssetGenerator:
             self.metadata_dir = Path(self.config.get('metadata_dir'))
         else:
             self.metadata_dir = Path.cwd() / '..' / 'blenderset-metadata'
+        if 'cache_dir' in self.config:
+            self.cache_dir = Path(self.config.get('cache_dir'))
+        else:
+            self.cache_dir = self.root / 'cache'
         if not self.root.exists():
             raise IOError('Cant find assets in ' + str(self.root))
         if not self.metadata_dir.exists():
@@ -1,4 +1,3 @@
-import json
 from math import dist
 from pathlib import Path
 from random import choice, uniform
@@ -16,6 +15,8 @@ import math
 from .assets import AssetGenerator, ComposedAssetGenerator
 from .utils import lens as lenses
 from .utils.debug import show_points, show_poly
+from .utils.images import load_image
+from .utils.materials import cached_material
 from .utils.lens import rotmat, rotmat_xyz
 from .utils.tags import get_all_tags, filter_by_tags
 from .camera import GenerateCameraFromBackground
@@ -117,7 +118,7 @@ class GenerateBackground(AssetGenerator):
     ):
         super().__init__(context)
         fn = self.metadata_dir / "images_metadata.json"
-        background_data = json.load(fn.open())
+        background_data = self.catalog.tag_index(("backgrounds", fn), lambda: self.catalog.json(fn))
         self.background_data = filter_by_tags(background_data, tags)
         self.lens = None
         if background_name == "{RANDOM}":
@@ -208,20 +209,29 @@ class GenerateBackground(AssetGenerator):
         # Roi
         shape = tuple(background_data["original_img_dimension"][::-1] + [3])
         h, w, _ = shape
-        if "poly" not in background_data:
-            background_data["poly"] = [[(0, 0), (0, h), (w, h), (w, 0)]]
-            background_data["image_height"] = h
-        for i, roi in enumerate(background_data["poly"]):
-            roi = self.image_roi_to_world(roi, shape, background_data["image_height"])
+        if "poly" in background_data:
+            polys = background_data["poly"]
+            image_height = background_data["image_height"]
+        else:
+            polys = [[(0, 0), (0, h), (w, h), (w, 0)]]
+            image_height = h
+        for i, roi in enumerate(polys):
+            roi = self.image_roi_to_world(roi, shape, image_height)
             # show_poly(roi)
             obj[f"blenderset.walkable_roi.{i}"] = [list(p) for p in roi]
 
-    def create_textured_material(self, image):
-        mat = bpy.data.materials.new(name="MaterialName")
+    def create_textured_material(self, image, roughness=0.75, specular=0.25):
         image = Path(image)
         if image.is_dir():
-            image = choice(list(image.glob("*")))
-        img = bpy.data.images.load(str(image))
+            image = choice(self.catalog.glob(image, "*"))
+        key = ("background", str(image), roughness, specular)
+        return cached_material(
+            key, lambda: self.build_textured_material(image, roughness, specular)
+        )
+
+    def build_textured_material(self, image, roughness, specular):
+        mat = bpy.data.materials.new(name="MaterialName")
+        img = load_image(image)
         mat.use_nodes = True
         tree = mat.node_tree
         nodes = tree.nodes
@@ -231,11 +241,11 @@ class GenerateBackground(AssetGenerator):
         output.location = (900, 0)
         diffuse = nodes.new(type="ShaderNodeBsdfPrincipled")
         diffuse.location = (600, 0)
-        diffuse.inputs["Roughness"].default_value = 0.75
+        diffuse.inputs["Roughness"].default_value = roughness
         if "Specular IOR Level" in diffuse.inputs:  # Blender 4
-            diffuse.inputs["Specular IOR Level"].default_value = 0.25
+            diffuse.inputs["Specular IOR Level"].default_value = specular
         else:
-            diffuse.inputs["Specular"].default_value = 0.25
+            diffuse.inputs["Specular"].default_value = specular
         coords = nodes.new(type="ShaderNodeTexCoord")
         coords.location = (0, 0)
         diffuseteximg = nodes.new(type="ShaderNodeTexImage")
@@ -259,7 +269,7 @@ class GenerateBackground(AssetGenerator):
 class GenerateSyntheticBackground(AssetGenerator):
     def __init__(self, context):
         super().__init__(context)
-        self.textures = list((self.root / "polyhaven").glob("*.blend"))
+        self.textures = self.catalog.glob(self.root / "polyhaven", "*.blend")
 
     def create(self):
         path = choice(self.textures)
@@ -1,3 +1,4 @@
+import logging
 from random import choice, shuffle
 import numpy as np
 from tempfile import NamedTemporaryFile
@@ -8,6 +9,12 @@ import bpy
 from blenderset.utils.tags import filter_by_tags
 from blenderset.assets import AssetGenerationFailed, AssetGenerator
 from .utils.debug import show_points, show_poly
+from .utils.images import load_image
+from .utils.library import cached_datablock
+from .utils.materials import cached_material
+from .utils.keyframes import ensure_action, ensure_fcurve, evaluate, set_keyframes
+from .utils.motion import load_motion_sequence
+from .utils.tempdir import temp_dir_for
 import json
 from time import time
 from shapely.geometry import MultiPolygon, Polygon, Point
@@ -15,6 +22,8 @@ from blenderset.assets import ComposedAssetGenerator
 from blenderset.background import GeneratePremadeBackground
 from blenderset.light import GenerateHdrDoomLight
 
+logger = logging.getLogger(__name__)
+
 
 class BedlamCreate(bpy.types.Operator):
     bl_idname = "blenderset.bedlam_create"
@@ -79,14 +88,13 @@ class GenerateBedlamClothes(ClothAssetGenerator):
         """
         assert step_size == 1
         cloth = self.anim_to_cloth(animation_fn)
-        texture = choice(list((cloth.parent.parent.parent / "clothing_textures").glob('*')))
+        texture = choice(self.catalog.glob(cloth.parent.parent.parent / "clothing_textures", '*'))
         diffuse = texture / (texture.name + '_diffuse_1001.png')
         normal = texture / (texture.name + '_normal_1001.png')
-        bpy.ops.wm.alembic_import(filepath=str(cloth), relative_path=False, as_background_job=False)
-        cloth_obj = self.context.object
+        cloth_obj = self.create_cloth_object(cloth, -100 - animation_offset)
         mat = create_textured_material(diffuse, normal)
-        cloth_obj.data.materials.append(mat)
-        cloth_obj.modifiers[0].cache_file.frame_offset = -100 - animation_offset
+        cloth_obj.material_slots[0].link = 'OBJECT'
+        cloth_obj.material_slots[0].material = mat
         cloth_obj.parent = obj
         cloth_obj.location[2] = height_offset
         cloth_obj['blenderset.animation'] = str(cloth)
@@ -94,15 +102,68 @@ class GenerateBedlamClothes(ClothAssetGenerator):
         obj['blenderset.player_type'] = 'Bystander'
 
 
+    def create_cloth_object(self, cloth, frame_offset):
+        """
+            Returns a new object playing the alembic cloth simulation `cloth`
+            shifted by `frame_offset` frames. Each simulation is only imported
+            once per blend file. Later objects are created directly from the
+            imported mesh and share the CacheFile datablock with all other
+            objects using the same simulation and offset.
+        """
+        template = cached_datablock(bpy.data.objects, ("bedlam_cloth", str(cloth)), lambda: import_cloth(cloth))
+        def copy_cache_file():
+            cache_file = template.modifiers[0].cache_file.copy()
+            cache_file.frame_offset = frame_offset
+            return cache_file
+        cache_file = cached_datablock(
+            bpy.data.cache_files, ("bedlam_cloth_cache", str(cloth), frame_offset), copy_cache_file
+        )
+        cloth_obj = template.copy()
+        cloth_obj.modifiers[0].cache_file = cache_file
+        self.context.view_layer.active_layer_collection.collection.objects.link(cloth_obj)
+        return cloth_obj
+
     def anim_to_cloth(self, fn):
         "Converts a BEDLAM animation filename to the corresponding cloth filename."
         root = self.root / "bedlam"
         name = fn.parent.name
         return root / "clothing" / fn.parent.parent.parent.name / "clothing_simulations" / name / (name + '.abc')
 
+    def cloth_simulations(self):
+        """
+            Returns the set of (subject, simulation) names of the BEDLAM cloth
+            simulations in the asset catalog. Each subject folder is listed
+            once per process instead of checking every animation separately.
+        """
+        root = self.root / "bedlam" / "clothing"
+        def scan():
+            return frozenset(
+                (subject, name)
+                for subject in self.catalog.subdirs(root)
+                for name in self.catalog.subdirs(root / subject / "clothing_simulations")
+            )
+        return self.catalog.memoize(('bedlam_cloth_simulations', root), scan)
+
     def filter_animations(self, animations):
         "Filter out the animations for which BEDLAM cloths exists in the asset catalog."
-        return [fn for fn in animations if self.anim_to_cloth(fn).exists()]
+        available = self.cloth_simulations()
+        return [fn for fn in animations if (fn.parent.parent.parent.name, fn.parent.name) in available]
+
+
+def import_cloth(cloth):
+    """
+        Import the alembic file `cloth` as a template object, that is not
+        linked to the scene but kept alive with a fake user. Its mesh is
+        given one (empty) material slot, to be linked to a material per object.
+    """
+    bpy.ops.wm.alembic_import(filepath=str(cloth), relative_path=False, as_background_job=False)
+    template = bpy.context.object
+    for collection in list(template.users_collection):
+        collection.objects.unlink(template)
+    template.use_fake_user = True
+    if len(template.data.materials) == 0:
+        template.data.materials.append(None)
+    return template
 
 
 class GenerateBedlam(AssetGenerator):
@@ -129,11 +190,11 @@ class GenerateBedlam(AssetGenerator):
         max_side = 512
         skins_root = root / f"bedlam_body_textures_meshcapade_{max_side}/smpl/MC_texture_skintones/"
         self.skins = dict(
-            male = list((skins_root / "male").rglob('*.png')),
-            female = list((skins_root / "female").rglob('*.png')),
+            male = self.catalog.rglob(skins_root / "male", '*.png'),
+            female = self.catalog.rglob(skins_root / "female", '*.png'),
         )
         self.eye = root / f"bedlam_body_textures_meshcapade_{max_side}/eye/SMPLX_eye.png"
-        self.animations = list((root / "gendered_ground_truth").rglob('*/motion_seq.npz'))
+        self.animations = self.catalog.rglob(root / "gendered_ground_truth", '*/motion_seq.npz')
         if cloth_generator is None:
             cloth_generator = GenerateBedlamClothes(context)
         self.cloth_generator = cloth_generator
@@ -147,8 +208,7 @@ class GenerateBedlam(AssetGenerator):
         context.scene.render.fps = 30
         for _ in range(self.nbr_of_bedlams):
             fn = choice(self.animations)
-            anim = np.load(fn)
-            data = {k: anim[k] for k in anim.keys()}
+            data = dict(load_motion_sequence(fn, self.motion_cache_dir(fn)))
             n = len(data['poses'])
             nbr_of_frames = min(self.nbr_of_frames, n)
             mocap_framerate = int(data["mocap_frame_rate"]) if "mocap_frame_rate" in data else int(data["mocap_framerate"])
@@ -157,9 +217,11 @@ class GenerateBedlam(AssetGenerator):
             nbr_of_frames *= step_size
 
             f = choice(range(len(data['poses']) - nbr_of_frames + 1))
-            for k in ['poses', 'global_ori', 'trans']:
-                data[k] = data[k][f:f+nbr_of_frames]
-            with NamedTemporaryFile(suffix='.npz') as tmp:
+            for k, v in data.items():
+                if v.ndim >= 2 and len(v) == n:  # Per frame data
+                    data[k] = v[f:f+nbr_of_frames]
+            size = sum(v.nbytes for v in data.values())
+            with NamedTemporaryFile(suffix='.npz', dir=temp_dir_for(size)) as tmp:
                 np.savez(tmp.name, **data)
                 bpy.ops.object.smplx_add_animation(filepath=tmp.name, anim_format='SMPL-X', target_framerate=target_framerate, keyframe_corrective_pose_weights=True)
 
@@ -188,6 +250,11 @@ class GenerateBedlam(AssetGenerator):
             bpy.context.scene.frame_set(nbr_of_frames // 2 + 1)
 
 
+    def motion_cache_dir(self, fn):
+        "Where the memory mappable version of the BEDLAM animation `fn` is stored."
+        relative = fn.relative_to(self.root / "bedlam" / "gendered_ground_truth")
+        return self.cache_dir / "bedlam_motion" / relative.parent
+
     def update_object(self, obj):
         obj.rotation_euler = [0, 0, np.random.uniform(0, 2 * np.pi)]
         object_meshes, other_meshes = self.get_object_meshes(obj)
@@ -208,32 +275,51 @@ def reset_pose_and_shape(armature):
     """
         Reset the pose and shape keys of an object to it's rest pose/shape and
         insert a keyframe at frame=0 that can be used for binding cloths to
-        the object.
+        the object. Only the shape keys of the meshes of `armature` are
+        affected. The keyframes are written directly to the fcurves.
     """
     if armature.type != 'ARMATURE':
         armature = armature.parent
     assert armature.type == 'ARMATURE'
+    action = ensure_action(armature)
     for bone in armature.pose.bones:
         bone.rotation_quaternion = [1,0,0,0]
         bone.location = [0,0,0]
-        bone.keyframe_insert(data_path="location", frame=0)
-        bone.keyframe_insert(data_path="rotation_quaternion", frame=0)
-
-    for shape_key in bpy.data.shape_keys:
+        path = bone.path_from_id()
+        for prop, rest in [("location", [0,0,0]), ("rotation_quaternion", [1,0,0,0])]:
+            for i, value in enumerate(rest):
+                fcurve = ensure_fcurve(action, f"{path}.{prop}", i, bone.name)
+                set_keyframes(fcurve, [0], [value])
+
+    shape_keys = {
+        o.data.shape_keys for o in armature.children_recursive
+        if o.type == 'MESH' and o.data.shape_keys is not None
+    }
+    for shape_key in shape_keys:
+        action = ensure_action(shape_key)
         for key in shape_key.key_blocks:
-            key.keyframe_insert(data_path="value", frame=1)
+            fcurve = ensure_fcurve(action, key.path_from_id("value"))
+            value = evaluate(fcurve, [1], key.value)[0]
+            set_keyframes(fcurve, [0, 1], [0, value])
             key.value = 0
-            key.keyframe_insert(data_path="value", frame=0)
 
     bpy.context.scene.frame_set(0)
 
 
-def create_textured_material(diffuse, normal=None, diffuse2=None):
+def create_textured_material(diffuse, normal=None, diffuse2=None, roughness=0.6, specular=0.5):
     """
-        Create a new material with the specified `diffuse` and `normal`
+        Returns a material with the specified `diffuse` and `normal`
         textures. The `diffuse2` texture with be alpha belnded ontop of
-        `diffuse`.
+        `diffuse`. Materials are shared between all objects using the same
+        textures and parameters.
     """
+    key = ("bedlam", str(diffuse), str(normal), str(diffuse2), roughness, specular)
+    return cached_material(
+        key, lambda: build_textured_material(diffuse, normal, diffuse2, roughness, specular)
+    )
+
+
+def build_textured_material(diffuse, normal, diffuse2, roughness, specular):
     mat = bpy.data.materials.new(name="MaterialName")
     mat.use_nodes = True
     tree = mat.node_tree
@@ -241,20 +327,20 @@ def create_textured_material(diffuse, normal=None, diffuse2=None):
     links = tree.links
     nodes.clear()
     diffuseteximg = nodes.new(type="ShaderNodeTexImage")
-    diffuseteximg.image = bpy.data.images.load(str(diffuse))
+    diffuseteximg.image = load_image(diffuse)
     diffuseteximg.location = (300, 0)
     output = nodes.new(type="ShaderNodeOutputMaterial")
     output.location = (900, 0)
     diffuse = nodes.new(type="ShaderNodeBsdfPrincipled")
     diffuse.location = (600, 0)
-    diffuse.inputs["Roughness"].default_value = 0.6
+    diffuse.inputs["Roughness"].default_value = roughness
     if "Specular IOR Level" in diffuse.inputs:
-        diffuse.inputs["Specular IOR Level"].default_value = 0.5
+        diffuse.inputs["Specular IOR Level"].default_value = specular
     else:
-        diffuse.inputs["Specular"].default_value = 0.5
+        diffuse.inputs["Specular"].default_value = specular
     if diffuse2 is not None:
         diffuseteximg2 = nodes.new(type="ShaderNodeTexImage")
-        diffuseteximg2.image = bpy.data.images.load(str(diffuse2))
+        diffuseteximg2.image = load_image(diffuse2)
         diffuseteximg2.location = (300, 300)
         mix = nodes.new(type="ShaderNodeMix")
         mix.data_type = 'RGBA'
@@ -269,7 +355,7 @@ def create_textured_material(diffuse, normal=None, diffuse2=None):
 
     if normal is not None:
         normal_img = nodes.new(type="ShaderNodeTexImage")
-        normal_img.image = bpy.data.images.load(str(normal))
+        normal_img.image = load_image(normal)
         normal_img.image.colorspace_settings.name = 'Non-Color'
         normal_img.location = (0, -300)
         normal_map = nodes.new(type="ShaderNodeNormalMap")
@@ -303,11 +389,11 @@ def adjust_height(context, obj, offset):
     height_offset = armature.location[2]
     armature.location[2] = 0
 
-    for frame in range(context.scene.frame_start, context.scene.frame_end + 1):
-        context.scene.frame_set(frame)
-        bone = armature.pose.bones['pelvis']
-        bone.location[1] += height_offset
-        bone.keyframe_insert('location', frame=frame)
+    # Offset the pelvis of all frames by editing the fcurve directly
+    frames = range(context.scene.frame_start, context.scene.frame_end + 1)
+    fcurve = ensure_fcurve(ensure_action(armature), 'pose.bones["pelvis"].location', 1, 'pelvis')
+    values = evaluate(fcurve, frames, armature.pose.bones['pelvis'].location[1])
+    set_keyframes(fcurve, frames, values + height_offset)
     return offset + height_offset
 
 
@@ -335,8 +421,8 @@ class GenerateSoccerClothes(ClothAssetGenerator):
             ['Socks_Short', 'Socks_Long'],
             ['Tshirt', 'Tshirt_Long Sleeve', 'Vest'],
         ]
-        self.names = [n.strip() for n in open(self.root / "names.txt").readlines()]
-        self.uniforms = json.load(open(self.root / 'JSONS' / 'team_uniforms.json'))
+        self.names = self.catalog.lines(self.root / "names.txt")
+        self.uniforms = self.catalog.json(self.root / 'JSONS' / 'team_uniforms.json')
 
     def create(self, obj, animation_fn, animation_offset, step_size, height_offset):
         clothes_names = [choice(alt) for alt in self.alternatives]
@@ -365,12 +451,7 @@ class GenerateSoccerClothes(ClothAssetGenerator):
             fn = fn.parent / (p + '_001_' + fn.name.replace('.json', '.png'))
             textures[self.template_texture_names[p]] = str(fn)
 
-        if 'female' in obj.name:
-            fn = self.root / 'Cloth_Assets' / 'Assets_Female.blend'
-        else:
-            fn = self.root / 'Cloth_Assets' / 'Assets_Male.blend'
-        with bpy.data.libraries.load(str(fn)) as (data_from, data_to):
-            data_to.objects = [n + '_001' for n in clothes_names if n is not None]
+        gender = 'female' if 'female' in obj.name else 'male'
 
         img_nbr, img_name = self.make_number_and_name(number, name)
         textures['Numb_39'] = img_nbr
@@ -378,69 +459,152 @@ class GenerateSoccerClothes(ClothAssetGenerator):
         obj['blenderset.jersey_number'] = number
         obj['blenderset.player_name'] = name
 
-        for clothes in data_to.objects:
+        for p in clothes_names:
+            if p is None:
+                continue
+            # The binding only depends on the garment and the rest pose body,
+            # so each garment is bound once per gender and then copied
+            template = cached_datablock(
+                bpy.data.objects, ("soccer_garment", gender, p),
+                lambda: self.bind_garment(gender, p, obj),
+            )
+            clothes = template.copy()
             bpy.context.scene.collection.objects.link(clothes)
             clothes.parent = armature
             for mod in clothes.modifiers:
                 if mod.type == 'SURFACE_DEFORM':
                     mod.target = obj
-                    bpy.ops.object.select_all(action='DESELECT')
-                    clothes.select_set(True)
-                    bpy.context.view_layer.objects.active = clothes
-                    bpy.ops.object.surfacedeform_bind(modifier=mod.name)
                 elif mod.type == 'ARMATURE':
                     mod.object = armature
 
             for slot in clothes.material_slots:
-                for node in slot.material.node_tree.nodes:
-                    if node.type=='TEX_IMAGE' and node.image:
-                        img = textures.get(node.image.name.split('.png')[0])
-                        if img is not None:
-                            if isinstance(img, str):
-                                fn = self.root / img
-                                img = bpy.data.images.load(str(fn))
-                            node.image = img
-                    elif node.type=='GROUP':
-                        node.inputs['Name Color'].default_value = name_color
-                        node.inputs['Number Color'].default_value = number_color
+                base = slot.material
+                slot.link = 'OBJECT'
+                slot.material = self.uniform_material(base, textures, number_color, name_color)
+
+    def bind_garment(self, gender, garment, body):
+        """
+            Returns the `garment` appended from the cloth assets of `gender`
+            with its surface deform modifiers bound to `body`, which has to
+            be in its rest pose and shape. The garment is not linked to the
+            scene and is kept alive with a fake user, as a template for the
+            clothes of later players.
+        """
+        fn = self.root / 'Cloth_Assets' / f'Assets_{gender.capitalize()}.blend'
+        with bpy.data.libraries.load(str(fn)) as (data_from, data_to):
+            data_to.objects = [garment + '_001']
+        template = data_to.objects[0]
+        bpy.context.scene.collection.objects.link(template)
+        for mod in template.modifiers:
+            if mod.type == 'SURFACE_DEFORM':
+                mod.target = body
+                bpy.ops.object.select_all(action='DESELECT')
+                template.select_set(True)
+                bpy.context.view_layer.objects.active = template
+                bpy.ops.object.surfacedeform_bind(modifier=mod.name)
+        bpy.context.scene.collection.objects.unlink(template)
+        template.use_fake_user = True
+        return template
+
+    def uniform_material(self, base, textures, number_color, name_color):
+        """
+            Returns a copy of the garment material `base` with the uniform
+            `textures` and the number and name colors applied. Players with
+            the same uniform, number and name share the material.
+        """
+        key = (
+            "soccer_uniform", base.name,
+            tuple(sorted((k, v if isinstance(v, str) else v.name) for k, v in textures.items())),
+            tuple(number_color), tuple(name_color),
+        )
+        def create():
+            mat = base.copy()
+            for node in mat.node_tree.nodes:
+                if node.type=='TEX_IMAGE' and node.image:
+                    img = textures.get(node.image.name.split('.png')[0])
+                    if img is not None:
+                        if isinstance(img, str):
+                            fn = self.root / img
+                            img = load_image(fn)
+                        node.image = img
+                elif node.type=='GROUP':
+                    node.inputs['Name Color'].default_value = name_color
+                    node.inputs['Number Color'].default_value = number_color
+            return mat
+        return cached_material(key, create)
 
     def make_number_and_name(self, nbr, name):
+        """
+            Returns image datablocks with the jersey number `nbr` and the
+            player `name`. The images are looked up in the manifest written by
+            `bake_numbers_and_names()` and only rendered if they are missing,
+            in which case they are added to the in-memory manifest.
+        """
         if nbr is None:
             nbr = ''
         if name is None:
             name = ''
+        manifest = self.text_image_manifest()
+        images = []
+        for kind, text in [('number', str(nbr)), ('name', name)]:
+            fn = manifest.get(kind, {}).get(text)
+            if fn is None:
+                logger.warning("No baked %s image for '%s', rendering it", kind, text)
+                fn = manifest.setdefault(kind, {})[text] = self.render_text_image(kind, text)
+            images.append(load_image(self.cache_dir / fn))
+        return tuple(images)
+
+    def text_image_manifest(self):
+        fn = self.cache_dir / 'manifest.json'
+        return self.catalog.memoize(
+            ('soccer_text_manifest', fn), lambda: json.load(fn.open()) if fn.exists() else {}
+        )
+
+    def render_text_image(self, kind, text):
+        """
+            Render `text` as a jersey number (`kind="number"`) or player name
+            (`kind="name"`) into the cache, unless it is already there. Returns
+            the filename relative to the cache directory.
+        """
         if not 'Number Gen' in bpy.data.scenes:
             fn = self.root / 'Templates' / 'Number and Names Generator_001.blend'
             with bpy.data.libraries.load(str(fn)) as (data_from, data_to):
                 data_to.scenes = data_from.scenes
 
-        ofn = self.root / 'cache' / 'number' / f'{nbr}.png'
+        relative = Path(kind) / f'{text}.png'
+        ofn = self.cache_dir / relative
         ofn.parent.mkdir(parents=True, exist_ok=True)
         if not ofn.exists():
-            scene = bpy.data.scenes['Number Gen']
-            text = [o for o in scene.objects if o.type == 'FONT'][0]
-            text.data.body = str(nbr)
-            text.data.size = 0.8
+            scene_name, size = dict(
+                number=('Number Gen', 0.8),
+                name=('Text Gen', 8 / (len(text) + 1e-2)),
+            )[kind]
+            scene = bpy.data.scenes[scene_name]
+            font = [o for o in scene.objects if o.type == 'FONT'][0]
+            font.data.body = text
+            font.data.size = size
             scene.render.filepath = str(ofn)
             scene.render.engine = "CYCLES"
             scene.cycles.samples = 1
-            bpy.ops.render.render(scene='Number Gen', write_still=True)
-        img_num = bpy.data.images.load(str(ofn))
+            bpy.ops.render.render(scene=scene_name, write_still=True)
+        return str(relative)
 
-        ofn = self.root / 'cache' / 'name' / f'{name}.png'
-        ofn.parent.mkdir(parents=True, exist_ok=True)
-        if not ofn.exists():
-            scene = bpy.data.scenes['Text Gen']
-            text = [o for o in scene.objects if o.type == 'FONT'][0]
-            text.data.body = name
-            text.data.size = 8 / (len(name) + 1e-2)
-            scene.render.filepath = str(ofn)
-            scene.render.engine = "CYCLES"
-            scene.cycles.samples = 1
-            bpy.ops.render.render(scene='Text Gen', write_still=True)
-        img_name = bpy.data.images.load(str(ofn))
-
-        return img_num, img_name
+    def bake_numbers_and_names(self, numbers=range(1, 100)):
+        """
+            Render all jersey `numbers` and all names from names.txt, as well
+            as the empty number and name used for referees, in one session and
+            write a manifest to the cache. After this, creating players does
+            not require any rendering.
+        """
+        manifest = dict(number={}, name={})
+        for kind, texts in [('number', [''] + [str(n) for n in numbers]), ('name', [''] + list(self.names))]:
+            for text in texts:
+                manifest[kind][text] = self.render_text_image(kind, text)
+        fn = self.cache_dir / 'manifest.json'
+        with open(fn, 'w') as fd:
+            json.dump(manifest, fd, indent=4)
+        self.catalog.forget(('soccer_text_manifest', fn))
+        return manifest
 
 
 class GenerateSoccerClothesTeam(GenerateSoccerClothes):
@@ -454,7 +618,7 @@ class GenerateSoccerClothesTeam(GenerateSoccerClothes):
         super().__init__(context)
         self.kind = kind
         self.player_type = player_type
-        del self.uniforms['Referee']
+        self.uniforms = {k: v for k, v in self.uniforms.items() if k != 'Referee'}
 
     def select_uniform(self):
         self.clothes_names = [choice(alt) for alt in self.alternatives]
@@ -612,7 +776,7 @@ class SoccerScene(ComposedAssetGenerator):
             GeneratePremadeBackground(
                 self.context,
                 # Path("/home/hakan/src/dev-scripts/allsvenskan/").glob("*/background_mix.blend"),
-                (self.root / "soccer_backgrounds").glob('*.blend'),
+                self.catalog.glob(self.root / "soccer_backgrounds", '*.blend'),
             ),
             GenerateHdrDoomLight(self.context),
             GenerateBedlam(self.context, GenerateSoccerClothes(self.context), nbr_of_bedlams=self.nbr_of_players, positioner=ExtendedRectanglePositioner()),
@@ -630,7 +794,7 @@ class SoccerSceneInPlay(ComposedAssetGenerator):
             GeneratePremadeBackground(
                 self.context,
                 # Path("/home/hakan/src/dev-scripts/allsvenskan/").glob("*/background_mix.blend"),
-                (self.root / "soccer_backgrounds").glob('*.blend'),
+                self.catalog.glob(self.root / "soccer_backgrounds", '*.blend'),
             ),
             GenerateHdrDoomLight(self.context),
             GenerateSoccerTeams(self.context, nbr_of_players=self.nbr_of_players),
@@ -0,0 +1,82 @@
+import functools
+import json
+import os
+from pathlib import Path
+
+from blenderset.utils.tags import TagIndex
+
+
+class AssetCatalog:
+    """
+        Process wide cache of asset directory listings and parsed metadata
+        files. Generators borrow the shared instance returned by
+        `get_catalog()`, which means that each directory scan and each json
+        parse is performed once per process, no matter how many generators
+        are composed or how many scenes are created. The returned values are
+        shared between all generators and must be treated as read-only.
+    """
+    config_file = Path.home() / '.config' / 'blenderset' / 'config.json'
+
+    def __init__(self):
+        self._cache = {}
+
+    def memoize(self, key, func):
+        "Return the value cached under `key`, calling `func()` to create it on first use."
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = func()
+            return value
+
+    def forget(self, key):
+        "Drop the value cached under `key`, if any."
+        self._cache.pop(key, None)
+
+    def clear(self):
+        "Forget everything, forcing the asset directories to be rescanned."
+        self._cache.clear()
+
+    @property
+    def config(self):
+        def load():
+            if self.config_file.exists():
+                return json.load(self.config_file.open())
+            return {}
+        return self.memoize(('config',), load)
+
+    def glob(self, root, pattern):
+        root = Path(root)
+        return self.memoize(('glob', root, pattern), lambda: tuple(root.glob(pattern)))
+
+    def rglob(self, root, pattern):
+        root = Path(root)
+        return self.memoize(('rglob', root, pattern), lambda: tuple(root.rglob(pattern)))
+
+    def subdirs(self, root):
+        "Returns the names of the directories in `root` using a single directory listing."
+        root = Path(root)
+        def scan():
+            try:
+                with os.scandir(root) as entries:
+                    return tuple(e.name for e in entries if e.is_dir())
+            except (FileNotFoundError, NotADirectoryError):
+                return ()
+        return self.memoize(('subdirs', root), scan)
+
+    def json(self, fn):
+        fn = Path(fn)
+        return self.memoize(('json', fn), lambda: json.load(fn.open()))
+
+    def lines(self, fn):
+        "Returns the stripped lines of the text file `fn`."
+        fn = Path(fn)
+        return self.memoize(('lines', fn), lambda: tuple(n.strip() for n in fn.open().readlines()))
+
+    def tag_index(self, key, build):
+        "Returns a memoized TagIndex over the collection returned by `build()`."
+        return self.memoize(('tag_index', key), lambda: TagIndex(build()))
+
+
+@functools.lru_cache(maxsize=None)
+def get_catalog():
+    return AssetCatalog()
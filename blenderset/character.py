@@ -1,4 +1,3 @@
-import json
 import logging
 import random
 from collections import defaultdict
@@ -8,6 +7,7 @@ import bpy
 import numpy as np
 
 from blenderset.assets import AssetGenerationFailed, AssetGenerator
+from blenderset.pool import get_object_pool
 from shapely.geometry import MultiPolygon, Polygon, Point
 
 from blenderset.utils.tags import filter_by_tags
@@ -62,9 +62,45 @@ class GenerateCharacter(AssetGenerator):
         self.nbr_of_characters = nbr_of_characters
         self.override_roi = roi
 
-        models = list(self.root.glob("*/*.[fF]bx"))
         character_metadata_path = self.metadata_dir / "character_metadata.json"
-        character_data = json.load(character_metadata_path.open())
+        model_data = self.catalog.tag_index(
+            ("characters", self.root, character_metadata_path),
+            lambda: self.load_model_data(character_metadata_path),
+        )
+        if not model_data:
+            raise FileNotFoundError(f"no character models (.fbx files) specified in {character_metadata_path.resolve()} found in {self.root.resolve()}")
+
+        self.model_data = filter_by_tags(model_data, tags)
+        if not self.model_data:
+            raise FileNotFoundError(f"no characters matched the tags: {tags}")
+
+        animation_metadata_path = self.metadata_dir / "animations_metadata.json"
+        animation_data = self.catalog.tag_index(
+            ("animations", animation_metadata_path),
+            lambda: self.catalog.json(animation_metadata_path),
+        )
+        if not animation_data:
+            raise FileNotFoundError(f"no animations specified in {animation_metadata_path.resolve()} found in {self.animation_root.resolve()}")
+
+        self.animation_data = filter_by_tags(animation_data, pose_tags)
+        if not self.animation_data:
+            raise FileNotFoundError(f"no animations matched the tags: {pose_tags}")
+
+        self.animation_names = defaultdict(list)
+        self.animation_lengths = defaultdict(list)
+        for key, entry in self.animation_data.items():
+            self.animation_names[entry["avatar"]].append(key)
+            self.animation_lengths[entry["avatar"]].append(entry["length"])
+
+        addons = bpy.context.preferences.addons
+        for name in addons.keys():
+            if name.startswith("cc_blender_tools-"):
+                addons[name].preferences.render_target = "CYCLES"
+
+    def load_model_data(self, character_metadata_path):
+        "Pairs the character models found on disk with their metadata and tags."
+        models = self.catalog.glob(self.root, "*/*.[fF]bx")
+        character_data = self.catalog.json(character_metadata_path)
         blocked = set(character_data['_blocked'])
         model_data = {}
         for fn in models:
@@ -72,7 +108,7 @@ class GenerateCharacter(AssetGenerator):
             if name in blocked:
                 continue
             try:
-                entry = character_data[name]
+                entry = dict(character_data[name])
             except KeyError:
                 logger.warning("No metadata for %s, skipping", name)
                 continue
@@ -97,32 +133,7 @@ class GenerateCharacter(AssetGenerator):
                 for val in values:
                     entry["tags"].append(t + ":" + val)
             model_data[fn] = entry
-        if not model_data:
-            raise FileNotFoundError(f"no character models (.fbx files) specified in {character_metadata_path.resolve()} found in {self.root.resolve()}")
-
-        self.model_data = filter_by_tags(model_data, tags)
-        if not self.model_data:
-            raise FileNotFoundError(f"no characters matched the tags: {tags}")
-
-        animation_metadata_path = self.metadata_dir / "animations_metadata.json"
-        animation_data = json.load(open(animation_metadata_path))
-        if not animation_data:
-            raise FileNotFoundError(f"no animations specified in {animation_metadata_path.resolve()} found in {self.animation_root.resolve()}")
-
-        self.animation_data = filter_by_tags(animation_data, pose_tags)
-        if not self.animation_data:
-            raise FileNotFoundError(f"no animations matched the tags: {pose_tags}")
-
-        self.animation_names = defaultdict(list)
-        self.animation_lengths = defaultdict(list)
-        for key, entry in self.animation_data.items():
-            self.animation_names[entry["avatar"]].append(key)
-            self.animation_lengths[entry["avatar"]].append(entry["length"])
-
-        addons = bpy.context.preferences.addons
-        for name in addons.keys():
-            if name.startswith("cc_blender_tools-"):
-                addons[name].preferences.render_target = "CYCLES"
+        return model_data
 
     def create(self, override_character=None):
         for _ in range(self.nbr_of_characters):
@@ -130,29 +141,84 @@ class GenerateCharacter(AssetGenerator):
                 character = random.choice(list(self.model_data.values()))
             else:
                 character = override_character
-            fn = character["fbx"]
-            print("Importing", fn)
-            try:
-                bpy.ops.cc3.importer(filepath=str(fn), param="IMPORT_QUALITY")
-            except RuntimeError as e:
-                if e.args != ('Error: Character has no Json data, using default values. \n\n',):
-                    raise
-
-            obj = self.context.object
-            while obj.parent is not None:
-                obj = obj.parent
+            obj = self.create_character(character)
             self.claim_object(obj)
-            obj.animation_data_clear()
             obj["blenderset.object_class"] = "human"
             avatar = character["avatar_base"]
             anim = random.choices(
                 self.animation_names[avatar], weights=self.animation_lengths[avatar]
             )[0]
             obj["blenderset.animation"] = self.ensure_animation_linked(anim)
-            self.create_head_mask_output(obj)
 
             self.update_object(obj)
 
+    def create_character(self, character):
+        """
+            Returns the root object of a new instance of `character`. It is
+            taken from the object pool if a previous scene left one there.
+            Otherwise it is appended from the baked character library if it
+            has been baked (see `bake_character`), or the fbx is imported.
+        """
+        pool = get_object_pool()
+        key = str(character["fbx"])
+        obj = pool.acquire(key, self.context.scene.collection)
+        if obj is None:
+            obj = self.load_character(character)
+            obj["blenderset.pool_key"] = key
+        ensure_head_mask_aov()
+        return obj
+
+    def load_character(self, character):
+        fn = self.baked_character_path(character)
+        baked = self.catalog.glob(fn.parent, "*.blend")
+        if fn not in baked:
+            return self.import_character(character)
+        with bpy.data.libraries.load(str(fn), link=False) as (data_src, data_dst):
+            data_dst.collections = data_src.collections
+        collection = data_dst.collections[0]
+        self.context.scene.collection.children.link(collection)
+        obj = collection.objects[0]
+        while obj.parent is not None:
+            obj = obj.parent
+        return obj
+
+    def import_character(self, character):
+        "Import the fbx of `character` and prepare it for rendering."
+        fn = character["fbx"]
+        print("Importing", fn)
+        try:
+            bpy.ops.cc3.importer(filepath=str(fn), param="IMPORT_QUALITY")
+        except RuntimeError as e:
+            if e.args != ('Error: Character has no Json data, using default values. \n\n',):
+                raise
+
+        obj = self.context.object
+        while obj.parent is not None:
+            obj = obj.parent
+        obj.animation_data_clear()
+        self.create_head_mask_output(obj)
+        return obj
+
+    def baked_character_path(self, character):
+        return self.cache_dir / "characters" / (character["fbx"].parent.name + ".blend")
+
+    def bake_character(self, character):
+        """
+            Import `character` and save it, including its materials and head
+            mask, as a collection in a separate .blend file in the character
+            library, from where `create` can append it much faster than the
+            fbx can be imported.
+        """
+        obj = self.import_character(character)
+        collection = bpy.data.collections.new("blenderset.character")
+        for o in [obj] + list(obj.children_recursive):
+            collection.objects.link(o)
+        fn = self.baked_character_path(character)
+        fn.parent.mkdir(parents=True, exist_ok=True)
+        bpy.data.libraries.write(str(fn), {collection}, path_remap="ABSOLUTE", fake_user=True)
+        self.catalog.forget(("glob", fn.parent, "*.blend"))
+        return fn
+
     def setup_render(self):
         bpy.ops.cc3.scene(param="CYCLES_SETUP")
 
@@ -230,13 +296,18 @@ class GenerateCharacter(AssetGenerator):
                 output.location = (300, 0)
                 tree.links.new(input.outputs["Alpha"], output.inputs["Value"])
 
-        for aov in bpy.context.scene.view_layers["View Layer"].aovs:
-            if aov.name == "HeadMask":
-                break
-        else:
-            bpy.ops.scene.view_layer_add_aov()
-            bpy.context.scene.view_layers["View Layer"].aovs[-1].name = "HeadMask"
-            bpy.context.scene.view_layers["View Layer"].aovs[-1].type = "VALUE"
+        ensure_head_mask_aov()
+
+
+def ensure_head_mask_aov():
+    "Add the HeadMask AOV written by the character materials to the view layer."
+    for aov in bpy.context.scene.view_layers["View Layer"].aovs:
+        if aov.name == "HeadMask":
+            break
+    else:
+        bpy.ops.scene.view_layer_add_aov()
+        bpy.context.scene.view_layers["View Layer"].aovs[-1].name = "HeadMask"
+        bpy.context.scene.view_layers["View Layer"].aovs[-1].type = "VALUE"
 
 
 class GenerateGalleryCharacter(GenerateCharacter):
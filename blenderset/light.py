@@ -59,7 +59,7 @@ class GenerateLightPlane(AssetGenerator):
 class GenerateHdrDoomLight(AssetGenerator):
     def create(self):
         sky_path = (self.root / "skys")
-        self.hdrs = list(sky_path.glob("*.hdr")) + list(sky_path.glob("*.exr"))
+        self.hdrs = self.catalog.glob(sky_path, "*.hdr") + self.catalog.glob(sky_path, "*.exr")
         if not self.hdrs:
             warn(f"no skies found in {sky_path.resolve()}")
         self.update()
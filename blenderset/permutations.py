@@ -0,0 +1,236 @@
+import bpy
+import numpy as np
+
+from blenderset.utils.keyframes import ensure_fcurve, set_keyframes
+
+
+class PermutationBaker:
+    """
+        Bakes permutations of a scene, as created by repeatedly calling
+        `AssetGenerator.update()`, onto consecutive frames, so that all of them
+        can be rendered with a single animation render. Call `record()` after
+        each permutation and `bake()` once all are recorded.
+
+        The transforms and poses of the objects claimed by asset generators,
+        and the numeric constraint settings such as path offsets, are
+        keyframed. Settings that can not be keyframed, such as constraint
+        targets and the HDR image of the world, are switched by a frame change
+        handler during rendering. Everything else animated in the scene, i.e.
+        the BEDLAM motions, their corrective shape keys and the cloth
+        simulations, is frozen at the frame the permutations were created at.
+    """
+    def __init__(self, context):
+        self.context = context
+        self.frame = context.scene.frame_current
+        self.values = []  # Per permutation: {(object, data path): values}
+        self.switches = []  # Per permutation: {(owner, attribute): value}
+        self.actions = {}  # object name -> action before baking
+        self.shape_key_actions = {}  # shape key name -> action before baking
+        self.cache_files = {}  # cache file name -> (override_frame, frame) before baking
+        self.frame_range = None
+
+    def record(self):
+        "Record the current state of the scene as the next permutation."
+        values = {}
+        switches = {}
+        for obj in self.context.scene.objects:
+            if "blenderset.creator_class" not in obj:
+                continue
+            for path, value in animated_properties(obj).items():
+                values[obj.name, path] = value
+            for (owner, attr), value in switched_properties(obj).items():
+                switches[owner, attr] = value
+        world = self.context.scene.world
+        if world is not None and world.node_tree is not None:
+            for node in world.node_tree.nodes:
+                if node.type == 'TEX_ENVIRONMENT':
+                    switches[node, "image"] = node.image
+        self.values.append(values)
+        self.switches.append(switches)
+
+    def bake(self):
+        """
+            Keyframe the recorded permutations onto consecutive frames starting
+            at the frame they were created at, and return those frames.
+        """
+        scene = self.context.scene
+        frames = range(self.frame, self.frame + len(self.values))
+        self.frame_range = (scene.frame_start, scene.frame_end)
+        scene.frame_start, scene.frame_end = frames[0], frames[-1]
+
+        for cache_file in bpy.data.cache_files:
+            if cache_file.override_frame:  # Already frozen by the user
+                continue
+            self.cache_files[cache_file.name] = (cache_file.override_frame, cache_file.frame)
+            cache_file.override_frame = True
+            cache_file.frame = self.frame
+        self.freeze_shape_keys()
+
+        for obj in self.baked_objects():
+            if obj.animation_data is None:
+                obj.animation_data_create()
+            self.actions[obj.name] = obj.animation_data.action
+            action = bpy.data.actions.new(name=obj.name + "Permutations")
+            obj.animation_data.action = action
+            paths = {path for v in self.values for name, path in v if name == obj.name}
+            for path in sorted(paths):
+                values = self.permutation_values(obj.name, path)
+                group = path.split('"')[1] if path.startswith("pose.bones") else "Object"
+                for i in range(values.shape[1]):
+                    set_keyframes(ensure_fcurve(action, path, i, group), frames, values[:, i])
+
+        if self.apply_switches not in bpy.app.handlers.frame_change_pre:
+            bpy.app.handlers.frame_change_pre.append(self.apply_switches)
+        scene.frame_set(frames[0])
+        return frames
+
+    def freeze_shape_keys(self):
+        """
+            Replace the actions of the shape keys in the scene, e.g. the
+            corrective pose weights of the BEDLAM bodies, by their values at
+            the frame the permutations were created at.
+        """
+        keys = {
+            obj.data.shape_keys for obj in self.context.scene.objects
+            if obj.type == 'MESH' and obj.data.shape_keys is not None
+        }
+        for key in keys:
+            if key.animation_data is None or key.animation_data.action is None:
+                continue
+            action = key.animation_data.action
+            values = [(fc.data_path, fc.array_index, fc.evaluate(self.frame)) for fc in action.fcurves]
+            self.shape_key_actions[key.name] = action
+            key.animation_data.action = None
+            for path, index, value in values:
+                owner_path, _, attr = path.rpartition(".")
+                owner = key.path_resolve(owner_path) if owner_path else key
+                current = getattr(owner, attr)
+                if hasattr(current, "__len__"):
+                    current[index] = value
+                else:
+                    setattr(owner, attr, value)
+
+    def permutation_values(self, name, path):
+        """
+            The values of the property `path` of the object `name` in each
+            permutation. Permutations that lack it, e.g. because a constraint
+            was added later, repeat the closest earlier (or later) value.
+        """
+        values = [v.get((name, path)) for v in self.values]
+        known = next(value for value in values if value is not None)
+        for i, value in enumerate(values):
+            if value is None:
+                values[i] = known
+            else:
+                known = value
+        return np.array(values, np.float32)
+
+    def baked_objects(self):
+        names = {name for v in self.values for name, _ in v}
+        return [bpy.data.objects[name] for name in sorted(names) if name in bpy.data.objects]
+
+    def apply_switches(self, scene, *args):
+        "Frame change handler applying the settings of the permutation rendered."
+        i = scene.frame_current - self.frame
+        if 0 <= i < len(self.switches):
+            self.apply_switches_for(i)
+
+    def apply_switches_for(self, i):
+        for (owner, attr), value in self.switches[i].items():
+            if getattr(owner, attr) != value:
+                setattr(owner, attr, value)
+
+    def restore(self):
+        """
+            Remove the baked keyframes and the frame change handler, and restore
+            the animations, frame range and current frame from before baking.
+            The scene is left in the state of the last permutation.
+        """
+        if self.apply_switches in bpy.app.handlers.frame_change_pre:
+            bpy.app.handlers.frame_change_pre.remove(self.apply_switches)
+        for name, action in self.actions.items():
+            obj = bpy.data.objects.get(name)
+            if obj is None:
+                continue
+            baked = obj.animation_data.action
+            obj.animation_data.action = action
+            if baked is not None and baked.users == 0:
+                bpy.data.actions.remove(baked)
+        self.actions = {}
+        for name, action in self.shape_key_actions.items():
+            key = bpy.data.shape_keys.get(name)
+            if key is not None:
+                key.animation_data.action = action
+        self.shape_key_actions = {}
+        for name, (override_frame, frame) in self.cache_files.items():
+            cache_file = bpy.data.cache_files.get(name)
+            if cache_file is not None:
+                cache_file.override_frame = override_frame
+                cache_file.frame = frame
+        self.cache_files = {}
+        scene = self.context.scene
+        if self.frame_range is not None:
+            scene.frame_start, scene.frame_end = self.frame_range
+        scene.frame_set(self.frame)
+        if self.values:
+            last = self.values[-1]
+            for (name, path), value in last.items():
+                if name in bpy.data.objects:
+                    set_property(bpy.data.objects[name], path, value)
+            self.apply_switches_for(len(self.switches) - 1)
+
+
+def rotation_property(owner):
+    "Name of the rotation property used by the rotation mode of `owner`."
+    return {
+        'QUATERNION': "rotation_quaternion",
+        'AXIS_ANGLE': "rotation_axis_angle",
+    }.get(owner.rotation_mode, "rotation_euler")
+
+
+def animated_properties(obj):
+    """
+        Returns the data paths and current values of the properties of `obj`
+        that a permutation may change and that can be keyframed.
+    """
+    props = {}
+
+    def add(owner, names):
+        prefix = owner.path_from_id() + "." if owner != obj else ""
+        for name in names:
+            if not hasattr(owner, name):
+                continue
+            value = getattr(owner, name)
+            props[prefix + name] = tuple(value) if hasattr(value, "__len__") else (value,)
+
+    add(obj, ["location", rotation_property(obj), "scale", "delta_location", "delta_rotation_euler"])
+    owners = [obj]
+    if obj.pose is not None:
+        for bone in obj.pose.bones:
+            add(bone, ["location", rotation_property(bone), "scale"])
+            owners.append(bone)
+    for owner in owners:
+        for con in owner.constraints:
+            add(con, ["influence", "offset_factor"])
+    return props
+
+
+def switched_properties(obj):
+    """
+        Returns the settings of `obj` that a permutation may change but that
+        can not be keyframed, as a dict mapping (owner, attribute) to value.
+    """
+    owners = [obj] + (list(obj.pose.bones) if obj.pose is not None else [])
+    switches = {}
+    for owner in owners:
+        for con in owner.constraints:
+            for attr in ["target", "forward_axis"]:
+                if hasattr(con, attr):
+                    switches[con, attr] = getattr(con, attr)
+    return switches
+
+
+def set_property(obj, path, value):
+    owner_path, _, attr = path.rpartition(".")
+    owner = obj.path_resolve(owner_path) if owner_path else obj
+    setattr(owner, attr, value if len(value) > 1 else value[0])
@@ -0,0 +1,161 @@
+import functools
+import logging
+from collections import OrderedDict
+
+import bpy
+
+from blenderset.catalog import get_catalog
+from blenderset.utils.images import get_image_cache
+
+logger = logging.getLogger(__name__)
+
+
+class ObjectPool:
+    """
+        Pool of previously created objects (e.g. imported characters with
+        their armatures, meshes and textures) that can be reused by later
+        scenes instead of being created again. Pooled objects are kept in a
+        collection that is not linked to any scene, so they are neither
+        visible nor rendered. At most `max_size` objects are kept, and at
+        most `max_per_key` for each key. When full, the objects that have
+        been in the pool the longest are deleted.
+
+        This only works if the blend file is kept between scenes, i.e. the
+        scene is cleared with `reset_scene()` instead of opening a new file.
+        Scenarios that open blend files themselves, such as `SoccerScene`
+        with its `GeneratePremadeBackground`, empty the pool. Currently only the CC3 characters of
+        `GenerateCharacter` are pooled.
+    """
+    collection_name = "blenderset.pool"
+
+    def __init__(self, max_size=50, max_per_key=3):
+        self.max_size = max_size
+        self.max_per_key = max_per_key
+        self.entries = OrderedDict()  # object name -> key
+        self.hits = 0
+        self.misses = 0
+
+    def collection(self):
+        collection = bpy.data.collections.get(self.collection_name)
+        if collection is None:
+            collection = bpy.data.collections.new(self.collection_name)
+            collection.use_fake_user = True
+        return collection
+
+    def acquire(self, key, collection):
+        """
+            Returns a pooled object created for `key`, moved into
+            `collection`, or None if there is none.
+        """
+        pooled = self.collection().objects
+        lost = [name for name in self.entries if name not in pooled]
+        if lost:
+            # For example by opening another blend file
+            logger.warning("Object pool: %d pooled objects were lost", len(lost))
+            for name in lost:
+                del self.entries[name]
+        for name, k in self.entries.items():
+            if k == key:
+                del self.entries[name]
+                obj = pooled[name]
+                move_hierarchy(obj, collection)
+                self.hits += 1
+                return obj
+        self.misses += 1
+        return None
+
+    def release(self, obj, key):
+        "Hand `obj` and its children over to the pool."
+        move_hierarchy(obj, self.collection())
+        del obj["blenderset.creator_class"]  # Not part of any scene any more
+        self.entries[obj.name] = key
+        self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.max_size or self.overfull_key() is not None:
+            key = self.overfull_key()
+            for name, k in self.entries.items():
+                if key is None or k == key:
+                    break
+            del self.entries[name]
+            if name in bpy.data.objects:
+                delete_hierarchy(bpy.data.objects[name])
+
+    def overfull_key(self):
+        counts = {}
+        for key in self.entries.values():
+            counts[key] = counts.get(key, 0) + 1
+            if counts[key] > self.max_per_key:
+                return key
+        return None
+
+    def reset_scene(self, context):
+        """
+            Remove all objects created by asset generators from the scene.
+            Objects with a "blenderset.pool_key" property are moved to the
+            pool, everything else is deleted. Unused datablocks are removed
+            as well, except linked ones such as the CC3 animations, which
+            would otherwise have to be linked again by the next scene, and
+            materials from `cached_material`. Finally the image cache is
+            given the chance to remove the textures no longer used.
+        """
+        roots = [
+            obj.name for obj in context.scene.objects
+            if "blenderset.creator_class" in obj
+            and not (obj.parent and "blenderset.creator_class" in obj.parent)
+        ]
+        emptied = set()
+        for name in roots:
+            obj = bpy.data.objects.get(name)
+            if obj is None:  # Deleted together with its parent
+                continue
+            for o in [obj] + list(obj.children_recursive):
+                emptied.update(o.users_collection)
+            if "blenderset.pool_key" in obj:
+                self.release(obj, obj["blenderset.pool_key"])
+            else:
+                delete_hierarchy(obj)
+        keep = {
+            context.scene.collection,
+            context.view_layer.active_layer_collection.collection,
+            self.collection(),
+        }
+        for collection in emptied - keep:
+            if len(collection.all_objects) == 0:
+                bpy.data.collections.remove(collection)
+        for datablocks in [
+            bpy.data.meshes,
+            bpy.data.armatures,
+            bpy.data.curves,
+            bpy.data.cameras,
+            bpy.data.lights,
+            bpy.data.actions,
+            bpy.data.materials,  # After the meshes, which use them
+        ]:
+            for block in list(datablocks):
+                if block.users == 0 and block.library is None and "blenderset.cache_key" not in block:
+                    datablocks.remove(block)
+        get_image_cache().evict()
+        logger.info(
+            "Object pool: %d objects, %d hits, %d misses",
+            len(self.entries), self.hits, self.misses,
+        )
+
+
+def move_hierarchy(obj, collection):
+    "Move `obj` and all its children into `collection` only."
+    for o in [obj] + list(obj.children_recursive):
+        for c in list(o.users_collection):
+            c.objects.unlink(o)
+        collection.objects.link(o)
+
+
+def delete_hierarchy(obj):
+    for o in list(obj.children_recursive) + [obj]:
+        bpy.data.objects.remove(o, do_unlink=True)
+
+
+@functools.lru_cache(maxsize=None)
+def get_object_pool():
+    config = get_catalog().config
+    return ObjectPool(config.get("pool_size", 50), config.get("pool_size_per_key", 3))
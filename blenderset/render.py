@@ -1,57 +1,276 @@
 import json
+import logging
+import shutil
+import tempfile
 import uuid
 from pathlib import Path
+from time import time
 
 import bpy
 import numpy as np
 from vi3o.image import imwrite
-import gzip
 
 from blenderset.camera import get_current_camera
+from blenderset.catalog import get_catalog
 from blenderset.keypoints import add_object_keypoints
-from blenderset.utils.exr import ExrFile
+from blenderset.permutations import PermutationBaker
+from blenderset.utils.depth import save_depth
+from blenderset.utils.exr import ExrFile, write_exr
+from blenderset.utils.segmentation import save_instances
+from blenderset.utils.tempdir import temp_dir_for
+
+logger = logging.getLogger(__name__)
+
+# Named sets of Renderer settings, ordered from cheapest to most expensive.
+# More profiles can be added with "quality_profiles" in the config file.
+QUALITY_PROFILES = {
+    "draft": dict(
+        samples=64, adaptive_threshold=0.1, time_limit=0, bounces=4,
+        use_denoising=True, clamp_direct=0, clamp_indirect=10,
+    ),
+    "low": dict(
+        samples=256, adaptive_threshold=0.05, time_limit=0, bounces=8,
+        use_denoising=True, clamp_direct=0, clamp_indirect=10,
+    ),
+    "medium": dict(
+        samples=1024, adaptive_threshold=0.02, time_limit=0, bounces=12,
+        use_denoising=True, clamp_direct=0, clamp_indirect=10,
+    ),
+    "high": dict(
+        samples=4096, adaptive_threshold=0.01, time_limit=0, bounces=None,
+        use_denoising=True, clamp_direct=None, clamp_indirect=None,
+    ),
+}
+
+
+def get_quality_profiles():
+    "The builtin quality profiles together with the ones from the config file."
+    return {**QUALITY_PROFILES, **get_catalog().config.get("quality_profiles", {})}
+
+# Generous bound of the number of float channels of the rendered EXRs: the
+# combined pass, depth, cryptomatte layers and AOVs such as the head mask
+EXR_CHANNELS = 32
 
 
 class Renderer:
     samples = 4096
+    adaptive_threshold = 0.01
+    time_limit = 0  # Seconds, 0 means no limit
     use_denoising = True
     device = "GPU"
+    # None uses the light path settings the scene had before any renderer
+    # changed them, see scene_light_paths()
+    bounces = None
+    clamp_direct = None
+    clamp_indirect = None
+    use_pass_combined = True
+    use_compositing = True
+    save_rgb = True
+    exr_codec = "ZIP"  # Compression of saved EXRs, lossless: "ZIP" or "PIZ"
+    exr_half = True  # Save color passes and AOVs of saved EXRs as half floats
+    depth_format = "float32"  # See blenderset.utils.depth.encode_depth
+    depth_range = (0.1, None)  # Near and far limits of the depth encoding
+
+    def __init__(
+        self, context, output_root, save_blend=False, save_exr=False, persistent_data=False, quality=None
+    ):
+        """
+            If `persistent_data` is True, Cycles keeps the synchronized scene
+            between renders, so that rendering new permutations of the same
+            scene, where the asset generator only moved or posed objects, does
+            not have to rebuild all BVHs and reload all textures. The render
+            settings are then only set up for the first render of each asset
+            generator and a warning is logged if a permutation changed more
+            than object transforms.
 
-    def __init__(self, context, output_root, save_blend=False, save_exr=False):
+            The `quality` is the name of one of the quality profiles from
+            `get_quality_profiles()`, overriding the sampling settings of the
+            class.
+        """
+        if quality is not None:
+            for name, value in get_quality_profiles()[quality].items():
+                setattr(self, name, value)
         self.context = context
         self.output_root = Path(output_root)
         self.save_blend = save_blend
         self.save_exr = save_exr
+        self.persistent_data = persistent_data
+        self.previous = None  # (asset generator, scene signature) of the last render
+        self.render_time = None  # Seconds spent in the last call to render()
 
     def setup(self):
         self.context.scene.render.engine = "CYCLES"
+        self.context.scene.render.use_persistent_data = self.persistent_data
         self.context.scene.cycles.samples = self.samples
         self.context.scene.cycles.use_denoising = self.use_denoising
         self.context.scene.cycles.use_adaptive_sampling = True
-        self.context.scene.cycles.adaptive_threshold = 0.01
+        self.context.scene.cycles.adaptive_threshold = self.adaptive_threshold
+        self.context.scene.cycles.time_limit = self.time_limit
         self.context.scene.cycles.device = self.device
-        self.context.scene.render.image_settings.file_format = "OPEN_EXR_MULTILAYER"
-        self.context.scene.render.image_settings.color_mode = "RGB"
+        light_paths = scene_light_paths(self.context.scene)
+        if self.bounces is not None:
+            for name in BOUNCES:
+                light_paths[name] = self.bounces
+        if self.clamp_direct is not None:
+            light_paths["sample_clamp_direct"] = self.clamp_direct
+        if self.clamp_indirect is not None:
+            light_paths["sample_clamp_indirect"] = self.clamp_indirect
+        for name, value in light_paths.items():
+            setattr(self.context.scene.cycles, name, value)
+        self.context.scene.render.use_compositing = self.use_compositing
+        self.context.window.view_layer.use_pass_combined = self.use_pass_combined
         self.context.window.view_layer.use_pass_cryptomatte_asset = True
         self.context.window.view_layer.use_pass_z = True
+
+    def setup_output(self):
+        self.context.scene.render.image_settings.file_format = "OPEN_EXR_MULTILAYER"
+        self.context.scene.render.image_settings.color_mode = "RGB"
         self.context.scene.render.image_settings.color_depth = "32"
 
+    def setup_permutation(self, asset_generator):
+        """
+            Set up the scene for rendering. With persistent data, changing
+            the render settings would make Cycles synchronize the entire scene
+            again, so they are only set up for the first permutation. For the
+            following ones it is verified that only transforms changed.
+        """
+        previous = self.previous
+        if self.persistent_data and previous is not None and previous[0] is asset_generator:
+            self.context.view_layer.update()
+            signature = scene_signature(self.context.scene)
+            if signature != previous[1]:
+                changed = [name for name in signature if signature[name] != previous[1][name]]
+                logger.warning(
+                    "Permutation changed more than transforms (%s), Cycles will synchronize them again",
+                    ", ".join(changed),
+                )
+        else:
+            self.setup()
+            asset_generator.setup_render()
+            self.context.view_layer.update()
+            signature = scene_signature(self.context.scene)
+        self.previous = (asset_generator, signature)
+        self.setup_output()
+
     def render_all_cameras(self, asset_generator, out_dir=None):
         if out_dir is None:
             out_dir = str(uuid.uuid1())
-        for cam in bpy.context.view_layer.objects:
-            if cam.type == 'CAMERA':
-                bpy.context.scene.camera = cam
-                composer_nodes = bpy.context.scene.node_tree.nodes
-                if 'blenderset.Background' in composer_nodes:
-                    composer_nodes['blenderset.Background'].image = cam.data.background_images[0].image
-                self.render(asset_generator, out_dir + '/' + cam.name)
+        for cam in self.cameras():
+            self.use_camera(cam)
+            self.render(asset_generator, out_dir + '/' + cam.name)
+
+    def cameras(self):
+        return [cam for cam in bpy.context.view_layer.objects if cam.type == 'CAMERA']
+
+    def use_camera(self, cam):
+        bpy.context.scene.camera = cam
+        composer_nodes = bpy.context.scene.node_tree.nodes
+        if 'blenderset.Background' in composer_nodes:
+            composer_nodes['blenderset.Background'].image = cam.data.background_images[0].image
 
     def render(self, asset_generator, out_dir=None):
-        self.setup()
-        asset_generator.setup_render()
+        self.setup_permutation(asset_generator)
         if out_dir is None:
             out_dir = str(uuid.uuid1())
+        out = self.create_output_dir(asset_generator, out_dir)
+
+        layers_dir = self.layers_dir()
+        try:
+            layers_path = layers_dir / "layers.exr"
+            self.context.scene.render.filepath = str(layers_path)
+
+            self.context.view_layer.update()
+            with SyncTimer() as timer:
+                bpy.ops.render.render(write_still=True)
+            self.render_time = timer.total
+            logger.info(
+                "Rendered %s in %.2fs, of which %.2fs synchronizing the scene",
+                out_dir, timer.total, timer.sync,
+            )
+
+            if self.save_rgb:
+                self.save_jpeg(bpy.data.images["Render Result"], out / "rgb.jpg")
+            self.save_annotations(out, layers_path)
+        finally:
+            shutil.rmtree(layers_dir, ignore_errors=True)
+        return out
+
+    def render_permutations(self, asset_generator, out_dirs):
+        """
+            Render `len(out_dirs)` permutations of the scene from all cameras,
+            like calling `render_all_cameras()` followed by
+            `asset_generator.update()` for each of them. The permutations are
+            baked onto consecutive frames and rendered with one animation
+            render per camera, which avoids the per render overhead and lets
+            Cycles reuse its session between the permutations. Afterwards the
+            scene is left in the state of the last permutation.
+        """
+        baker = PermutationBaker(self.context)
+        for i in range(len(out_dirs)):
+            if i > 0:
+                asset_generator.update()
+            baker.record()
+        try:
+            frames = baker.bake()
+            outs = []
+            for cam in self.cameras():
+                self.use_camera(cam)
+                outs += self.render_frames(
+                    asset_generator, frames, [out_dir + '/' + cam.name for out_dir in out_dirs]
+                )
+        finally:
+            baker.restore()
+        return outs
+
+    def render_frames(self, asset_generator, frames, out_dirs):
+        "Render `frames` as one animation, writing each to its own of `out_dirs`."
+        self.setup_permutation(asset_generator)
+        scene = self.context.scene
+        outs = [self.create_output_dir(asset_generator, out_dir) for out_dir in out_dirs]
+        # The animation render writes all frames before returning, so the
+        # temporary directory has to fit all of them
+        frames_dir = self.layers_dir(len(frames))
+        try:
+            scene.render.filepath = str(frames_dir / "layers_")
+            scene.render.use_file_extension = True
+
+            with SyncTimer() as timer:
+                bpy.ops.render.render(animation=True)
+            logger.info(
+                "Rendered %d frames in %.2fs, of which %.2fs synchronizing the scene",
+                len(frames), timer.total, timer.sync,
+            )
+
+            for frame, out in zip(frames, outs):
+                scene.frame_set(frame)
+                layers_path = Path(scene.render.frame_path(frame=frame))
+                if self.save_rgb:
+                    image = bpy.data.images.load(str(layers_path))
+                    self.save_jpeg(image, out / "rgb.jpg")
+                    bpy.data.images.remove(image)
+                self.save_annotations(out, layers_path)  # Removes the frame's EXR
+        finally:
+            shutil.rmtree(frames_dir, ignore_errors=True)
+        return outs
+
+    def layers_dir(self, frames=1):
+        """
+            A new directory for the full precision multilayer EXRs of `frames`
+            frames the annotations are read from. It is placed in RAM if there
+            is room for them there, and on disk otherwise. Each EXR is removed
+            once read, and is only saved in the output directory, re-encoded,
+            if `save_exr` is set. The caller removes the directory.
+        """
+        return Path(tempfile.mkdtemp(prefix="blenderset_", dir=temp_dir_for(frames * self.layers_size())))
+
+    def layers_size(self):
+        "Upper bound of the size in bytes of the multilayer EXR of one frame."
+        render = self.context.scene.render
+        scale = render.resolution_percentage / 100
+        pixels = round(render.resolution_x * scale) * round(render.resolution_y * scale)
+        return pixels * EXR_CHANNELS * 4
+
+    def create_output_dir(self, asset_generator, out_dir):
         out = self.output_root / out_dir
         out.mkdir(parents=True, exist_ok=True)
 
@@ -62,17 +281,15 @@ class Renderer:
         )
         with open(out / "scene_info.json", "w") as fd:
             json.dump(scene_info, fd)
+        return out
 
-        layers_path = out / "layers.exr"
-        self.context.scene.render.filepath = str(layers_path)
-
-        self.context.view_layer.update()
-        bpy.ops.render.render(write_still=True)
-
+    def save_jpeg(self, image, filename):
         self.context.scene.render.image_settings.file_format = "JPEG"
         self.context.scene.render.image_settings.color_depth = "8"
-        bpy.data.images["Render Result"].save_render(str(out / "rgb.jpg"))
+        image.save_render(str(filename))
+        self.setup_output()
 
+    def save_annotations(self, out, layers_path):
         camera_matrix, lens = get_current_camera()
         np.save(out / "camera_matrix.npy", camera_matrix)
         lens.save_json(out / "lens.json")
@@ -85,8 +302,7 @@ class Renderer:
         objects, segmentations = exr.get_objects()
         add_object_keypoints(objects, camera_matrix, lens)
         assert len(segmentations) == 1
-        with gzip.GzipFile(out / "segmentations.npy.gz", "w") as fd:
-            np.save(fd, segmentations[0])
+        save_instances(out, segmentations[0], objects)
         with (out / "objects.json").open("w") as fd:
             json.dump(objects, fd)
         head_mask = exr.get_head_mask()
@@ -94,13 +310,94 @@ class Renderer:
             imwrite(255 * head_mask.astype(np.uint8), str(out / "head_mask.png"))
 
         depth = exr.get_depth_image()
-        with gzip.GzipFile(out / "depth.npy.gz", "w") as fd:
-            np.save(fd, depth)
+        save_depth(out, depth, self.depth_format, *self.depth_range)
 
-        if not self.save_exr:
-            layers_path.unlink()
+        if self.save_exr:
+            size, seconds = write_exr(
+                layers_path, out / "layers.exr", compression=self.exr_codec, half=self.exr_half
+            )
+            logger.info(
+                "Saved %s: %.1f MB, written in %.2fs", out / "layers.exr", size / 2 ** 20, seconds
+            )
+        layers_path.unlink()
+
+
+class SyncTimer:
+    """
+        Measures the wall time of a render and the part of it spent before
+        Cycles started sampling, i.e. synchronizing the scene, building BVHs
+        and loading textures. The end of the synchronization is detected
+        from the render stats reported by Cycles.
+    """
+    def __enter__(self):
+        self.start = time()
+        self.sync = self.total = None
+        bpy.app.handlers.render_stats.append(self.on_stats)
+        return self
+
+    def on_stats(self, *args):
+        stats = " ".join(a for a in args if isinstance(a, str))
+        if self.sync is None and ("Sample" in stats or "Rendering" in stats):
+            self.sync = time() - self.start
+
+    def __exit__(self, *exc):
+        bpy.app.handlers.render_stats.remove(self.on_stats)
+        self.total = time() - self.start
+        if self.sync is None:
+            self.sync = self.total
 
-        return out
+
+def scene_signature(scene):
+    """
+        Everything about `scene` that Cycles needs to synchronize again when
+        it changes, except object transforms and poses. Returns a dict of
+        comparable values.
+    """
+    return dict(
+        objects=sorted(
+            (
+                obj.name,
+                obj.type,
+                obj.data.name if obj.data is not None else None,
+                obj.hide_render,
+                tuple((m.name, m.type, m.show_render) for m in obj.modifiers),
+                tuple(s.material.name if s.material else None for s in obj.material_slots),
+            )
+            for obj in scene.objects
+        ),
+        world=world_signature(scene.world),
+        materials=sorted(bpy.data.materials.keys()),
+        images=sorted((img.name, img.filepath) for img in bpy.data.images if img.type == "IMAGE"),
+    )
+
+
+BOUNCES = ["max_bounces", "diffuse_bounces", "glossy_bounces", "transmission_bounces", "volume_bounces"]
+
+
+def scene_light_paths(scene):
+    """
+        The bounce and clamping settings of `scene` from before the first
+        renderer changed them. They are stored in the scene on first use, so
+        that a renderer that does not override them, e.g. the "high" profile,
+        is not affected by an earlier draft or annotation render.
+    """
+    if "blenderset.light_paths" not in scene:
+        names = BOUNCES + ["sample_clamp_direct", "sample_clamp_indirect"]
+        scene["blenderset.light_paths"] = {name: getattr(scene.cycles, name) for name in names}
+    return scene["blenderset.light_paths"].to_dict()
+
+
+def world_signature(world):
+    "The name of `world` and the images of its environment textures."
+    if world is None:
+        return None
+    images = []
+    if world.node_tree is not None:
+        images = sorted(
+            node.image.name for node in world.node_tree.nodes
+            if node.type == 'TEX_ENVIRONMENT' and node.image is not None
+        )
+    return (world.name, tuple(images))
 
 
 class PreviewRenderer(Renderer):
@@ -110,3 +407,16 @@ class PreviewRenderer(Renderer):
 
 class PreviewCPURenderer(PreviewRenderer):
     device = "CPU"
+
+
+class AnnotationRenderer(PreviewCPURenderer):
+    """
+        Renders only the annotations, i.e. objects.json, segmentations, depth
+        and head masks, but no image. The combined pass, the compositor and
+        all indirect light are disabled, so each pixel costs a single camera
+        ray and shader evaluation for the cryptomatte, Z and HeadMask passes.
+    """
+    bounces = 0
+    use_pass_combined = False
+    use_compositing = False
+    save_rgb = False
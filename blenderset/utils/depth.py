@@ -0,0 +1,125 @@
+import gzip
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Code used by the uint16 formats for pixels beyond the far limit, e.g. the sky
+INVALID = 2 ** 16 - 1
+
+# Relative rounding error of the float32 depths returned by decode_depth
+FLOAT32_ROUNDING = 2.0 ** -24
+
+# The largest depth each format can represent, used as default far limit
+MAX_DEPTH = dict(
+    float32=float(np.finfo(np.float32).max),
+    float16=float(np.finfo(np.float16).max),
+    uint16_mm=(INVALID - 1) / 1000,
+    log_uint16=1000.0,
+)
+
+
+def encode_depth(depth, format="float32", near=0.1, far=None):
+    """
+        Encode the depth image `depth` (in meters) in one of these formats:
+
+            float32:    Unchanged.
+            float16:    Half floats. The relative error is at most 2**-11
+                        (0.05%) and depths beyond `far` (at most 65504) are
+                        stored as inf.
+            uint16_mm:  Millimeters, clipped to `near` below. The error is at
+                        most 0.5 mm, plus the float32 rounding of the decoded
+                        depth. Depths beyond `far` (at most 65.534 m) are
+                        stored as `INVALID`.
+            log_uint16: The logarithm of the depth, quantized uniformly
+                        between `near` and `far`, giving a relative error of
+                        at most log(far / near) / 131068 plus the float32
+                        rounding, i.e. 0.007% for the default range. Depths beyond `far` are stored as
+                        `INVALID`, and depths below `near` are clipped.
+
+        If `far` is None, it defaults to the largest depth of the format, see
+        `MAX_DEPTH`. Returns the encoded array and the metadata needed to
+        decode it with `decode_depth`.
+    """
+    depth = np.asarray(depth, np.float32)
+    if format not in MAX_DEPTH:
+        raise ValueError(f"Unknown depth format '{format}'")
+    if far is None:
+        far = MAX_DEPTH[format]
+    if not near < far <= MAX_DEPTH[format] or (format == "log_uint16" and near <= 0):
+        raise ValueError(
+            f"Invalid depth range {near} to {far} for format '{format}', "
+            f"which supports depths up to {MAX_DEPTH[format]}"
+        )
+    metadata = dict(format=format, near=near, far=far)
+    if format == "float32":
+        return depth, metadata
+    beyond = ~(depth <= far)
+    if format == "float16":
+        encoded = np.where(beyond, np.inf, depth).astype(np.float16)
+        metadata["max_relative_error"] = 2.0 ** -11
+    elif format == "uint16_mm":
+        metadata["scale"] = 0.001
+        mm = np.clip(depth.astype(np.float64), near, far) / metadata["scale"]
+        encoded = np.round(mm).astype(np.uint16)
+        encoded[beyond] = INVALID
+        metadata["max_error"] = metadata["scale"] / 2 + far * FLOAT32_ROUNDING
+    elif format == "log_uint16":
+        metadata["scale"] = float(np.log(far / near) / (INVALID - 1))
+        log_depth = np.log(np.clip(depth.astype(np.float64), near, far) / near)
+        encoded = np.round(log_depth / metadata["scale"]).astype(np.uint16)
+        encoded[beyond] = INVALID
+        metadata["max_relative_error"] = float(np.expm1(metadata["scale"] / 2)) + FLOAT32_ROUNDING
+    metadata["invalid"] = INVALID
+    return encoded, metadata
+
+
+def decode_depth(encoded, metadata=None):
+    """
+        Decode a depth image encoded by `encode_depth`. Invalid depths become
+        inf. The quantized formats are decoded in double precision, so that
+        only the final rounding to float32 adds to the quantization error.
+    """
+    if metadata is None or metadata["format"] == "float32":
+        return np.asarray(encoded, np.float32)
+    format = metadata["format"]
+    if format == "float16":
+        return encoded.astype(np.float32)
+    if format == "uint16_mm":
+        depth = encoded.astype(np.float64) * metadata["scale"]
+    elif format == "log_uint16":
+        depth = metadata["near"] * np.exp(encoded.astype(np.float64) * metadata["scale"])
+    else:
+        raise ValueError(f"Unknown depth format '{format}'")
+    depth[encoded == metadata["invalid"]] = np.inf
+    return depth.astype(np.float32)
+
+
+def save_depth(out, depth, format="float32", near=0.1, far=None):
+    """
+        Save the depth image `depth` encoded as `format` in `out` as
+        depth.npy.gz, with the metadata needed to decode it in depth.json.
+    """
+    out = Path(out)
+    encoded, metadata = encode_depth(depth, format, near, far)
+    with gzip.GzipFile(out / "depth.npy.gz", "w") as fd:
+        np.save(fd, encoded)
+    with (out / "depth.json").open("w") as fd:
+        json.dump(metadata, fd)
+
+
+def load_depth(path):
+    """
+        Load the depth image, in meters, saved in the render directory `path`.
+        Depth images saved without metadata are float32.
+    """
+    path = Path(path)
+    if (path / "depth.npy").exists():
+        encoded = np.load(path / "depth.npy")
+    else:
+        with gzip.GzipFile(path / "depth.npy.gz", "r") as fd:
+            encoded = np.load(fd)
+    metadata = None
+    if (path / "depth.json").exists():
+        metadata = json.loads((path / "depth.json").read_text())
+    return decode_depth(encoded, metadata)
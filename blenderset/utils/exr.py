@@ -1,6 +1,8 @@
 import json
+import os
 import struct
 from collections import defaultdict
+from time import time
 
 import Imath
 import OpenEXR
@@ -9,6 +11,12 @@ import bpy
 import numpy as np
 from blenderset.utils import mesh
 
+FLOAT = Imath.PixelType(Imath.PixelType.FLOAT)
+HALF = Imath.PixelType(Imath.PixelType.HALF)
+
+# Compressions that quantize float channels, which would corrupt cryptomatte IDs
+LOSSY_COMPRESSIONS = {"DWAA", "DWAB", "B44", "B44A", "PXR24"}
+
 
 class ExrFile:
     def __init__(self, filename):
@@ -17,6 +25,10 @@ class ExrFile:
         dw = self.header["dataWindow"]
         self.shape = (dw.max.y - dw.min.y + 1, dw.max.x - dw.min.x + 1)
 
+    def channel(self, name):
+        "The channel `name` as float32, whether it is stored as half or float."
+        return np.frombuffer(self.exr.channel(name, FLOAT), np.float32).reshape(self.shape)
+
     def get_objects(self):
         cryptomatte = defaultdict(dict)
         for k in self.header.keys():
@@ -106,36 +118,65 @@ class ExrFile:
         return objects, all_segmentations
 
     def get_depth_image(self, name="View Layer.Depth.Z"):
-        assert self.header["channels"][name] == Imath.Channel(
-            Imath.PixelType(Imath.PixelType.FLOAT), 1, 1
-        )
-        return np.frombuffer(self.exr.channel(name), np.float32).reshape(self.shape).astype(np.float32)
+        return self.channel(name).copy()
 
     def get_rgb_image(self, name="View Layer.Combined"):
         img = np.zeros(self.shape + (3,), np.float32)
         for i, ch in enumerate("RGB"):
-            p = name + "." + ch
-            assert self.header["channels"][p] == Imath.Channel(
-                Imath.PixelType(Imath.PixelType.FLOAT), 1, 1
-            )
-            img[:, :, i] = (
-                np.frombuffer(self.exr.channel(p), np.float32)
-                .reshape(self.shape)
-                .astype(np.float32)
-            )
+            img[:, :, i] = self.channel(name + "." + ch)
         return img
 
     def get_head_mask(self):
         p = "View Layer.HeadMask.X"
         if p not in self.header["channels"]:
             return None
-        assert self.header["channels"][p] == Imath.Channel(
-            Imath.PixelType(Imath.PixelType.FLOAT), 1, 1
-        )
-        mask = np.frombuffer(self.exr.channel(p), np.float32).reshape(self.shape) > 0
+        mask = self.channel(p) > 0
         return mask
 
 
+def full_precision_channel(name):
+    "Channels that have to be stored as 32 bit floats, i.e. cryptomatte IDs and depth."
+    return "Crypto" in name or ".Depth." in name
+
+
+def write_exr(src, dst, compression="ZIP", half=True):
+    """
+        Re-encode the EXR file `src` as `dst` with `compression` ("ZIP",
+        "PIZ", ...). If `half` is True, all channels except the cryptomatte
+        and depth ones are stored as half floats. The header, including the
+        cryptomatte manifests, is kept. Lossy compressions, see
+        `LOSSY_COMPRESSIONS`, are only allowed if there are no cryptomatte or
+        depth channels. Returns the size of `dst` in bytes and the number of
+        seconds it took to write it.
+    """
+    exr = OpenEXR.InputFile(str(src))
+    header = dict(exr.header())
+    if compression in LOSSY_COMPRESSIONS:
+        exact = [name for name in header["channels"] if full_precision_channel(name)]
+        if exact:
+            exr.close()
+            raise ValueError(
+                f"{compression} compression is lossy and would corrupt the channels {', '.join(exact)}"
+            )
+    channels = {}
+    pixels = {}
+    for name, channel in header["channels"].items():
+        if half and channel.type == FLOAT and not full_precision_channel(name):
+            channels[name] = Imath.Channel(HALF)
+            pixels[name] = np.frombuffer(exr.channel(name, FLOAT), np.float32).astype(np.float16).tobytes()
+        else:
+            channels[name] = channel
+            pixels[name] = exr.channel(name)
+    exr.close()
+    header["channels"] = channels
+    t0 = time()
+    header["compression"] = Imath.Compression(getattr(Imath.Compression, compression + "_COMPRESSION"))
+    out = OpenEXR.OutputFile(str(dst), header)
+    out.writePixels(pixels)
+    out.close()
+    return os.path.getsize(dst), time() - t0
+
+
 def linear_to_srgb(x):
     out = np.empty_like(x)
     msk = x < 0.0031308
@@ -1,5 +1,7 @@
 import bpy
 
+from blenderset.utils.images import load_image
+
 
 def hdr_swap(name, hdr):
     """
@@ -64,15 +66,6 @@ def get_node_sure(node_tree, ntype=""):
 
 def load_HDR(file_name, name):
     """Load a HDR into file and link it to scene world."""
-    already_linked = False
-    for i in bpy.data.images:
-        if i.filepath == file_name:
-            hdr = i
-            already_linked = True
-            break
-
-    if not already_linked:
-        hdr = bpy.data.images.load(file_name)
-
+    hdr = load_image(file_name)
     hdr_swap(name, hdr)
     return hdr
@@ -0,0 +1,96 @@
+import functools
+from collections import OrderedDict
+from pathlib import Path
+
+import bpy
+
+from blenderset.catalog import get_catalog
+
+
+class ImageCache:
+    """
+        Deduplicating cache of image datablocks keyed by resolved file path.
+        Loading the same file twice returns the already loaded image. Once the
+        pixel memory of the images exceeds `budget` bytes, the least recently
+        used images that are no longer used by any material are removed from
+        the blend file. Blender only reads the pixels of an image when they
+        are first needed, e.g. for rendering, so images that were never
+        decoded are not counted.
+    """
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.images = OrderedDict()  # path -> image name
+
+    def get(self, fn):
+        "Returns the image loaded from `fn` if it is still present, else None."
+        key = resolve(fn)
+        name = self.images.get(key)
+        if name is None:
+            return None
+        img = bpy.data.images.get(name)
+        if img is None or img.filepath != key:
+            # Removed or replaced, for example by loading a new blend file
+            del self.images[key]
+            return None
+        self.images.move_to_end(key)
+        return img
+
+    def load(self, fn):
+        img = self.get(fn)
+        if img is not None:
+            return img
+        key = resolve(fn)
+        img = bpy.data.images.load(key, check_existing=True)
+        self.images[key] = img.name
+        self.evict(keep=key)
+        return img
+
+    def loaded_bytes(self):
+        "The pixel memory of the cached images that have been decoded."
+        images = (bpy.data.images.get(name) for name in self.images.values())
+        return sum(image_bytes(img) for img in images if img is not None and img.has_data)
+
+    def evict(self, keep=None):
+        "Remove unused images, oldest first, until the budget is met."
+        if self.budget is None:
+            return
+        loaded_bytes = self.loaded_bytes()
+        for key, name in list(self.images.items()):
+            if loaded_bytes <= self.budget:
+                break
+            if key == keep:
+                continue
+            img = bpy.data.images.get(name)
+            if img is not None and img.users > 0:
+                continue
+            if img is not None:
+                if img.has_data:
+                    loaded_bytes -= image_bytes(img)
+                bpy.data.images.remove(img)
+            del self.images[key]
+
+
+@functools.lru_cache(maxsize=4096)
+def resolve(fn):
+    return str(Path(fn).resolve())
+
+
+def image_bytes(img):
+    """
+        The memory used by the pixels of the image `img`. Only call this for
+        images with `has_data` set, as reading the size of an image that has
+        not been decoded yet makes Blender decode it.
+    """
+    width, height = img.size
+    return width * height * img.channels * (4 if img.is_float else 1)
+
+
+@functools.lru_cache(maxsize=None)
+def get_image_cache():
+    budget = get_catalog().config.get("image_cache_mb")
+    return ImageCache(None if budget is None else budget * 2 ** 20)
+
+
+def load_image(fn):
+    "Load the image `fn` through the process wide image cache."
+    return get_image_cache().load(fn)
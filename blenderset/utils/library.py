@@ -0,0 +1,69 @@
+import bpy
+
+# Maps cache keys to the names of the datablocks created for them
+_datablocks = {}
+
+
+def cached_datablock(datablocks, key, create):
+    """
+        Returns the datablock in `datablocks` (e.g. `bpy.data.materials`)
+        previously created for `key`, or calls `create()` to create it the
+        first time the key is seen in the current blend file. The key should
+        be a tuple of everything the datablock depends on.
+    """
+    key = repr(key)
+    name = _datablocks.get(key)
+    block = datablocks.get(name) if name is not None else None
+    if block is None or block.get("blenderset.cache_key") != key:
+        block = create()
+        block["blenderset.cache_key"] = key
+        _datablocks[key] = block.name
+    return block
+
+
+def append_collection(fn):
+    """
+        Append the first collection of the blend file `fn`. It is not linked
+        to the scene and is kept alive with a fake user, so that it can be
+        used as a template for `instance_collection`.
+    """
+    with bpy.data.libraries.load(str(fn), link=False) as (data_src, data_dst):
+        data_dst.collections = data_src.collections
+    collection = data_dst.collections[0]
+    collection.use_fake_user = True
+    return collection
+
+
+def append_material(fn):
+    "Append the first material of the blend file `fn`."
+    with bpy.data.libraries.load(str(fn), link=False) as (data_src, data_dst):
+        data_dst.materials = data_src.materials
+    return data_dst.materials[0]
+
+
+def instance_collection(template):
+    """
+        Returns a new collection with copies of the objects in `template`.
+        Mesh data is shared with the template (linked duplicates) while
+        armatures are copied so that each instance can be posed separately.
+        Parents, modifiers and constraints referring to objects within the
+        template are remapped to the copies.
+    """
+    collection = bpy.data.collections.new(template.name)
+    copies = {}
+    for obj in template.all_objects:
+        copy = obj.copy()
+        if obj.type == "ARMATURE":
+            copy.data = obj.data.copy()
+        copies[obj] = copy
+        collection.objects.link(copy)
+    for copy in copies.values():
+        if copy.parent in copies:
+            copy.parent = copies[copy.parent]
+        for mod in copy.modifiers:
+            if getattr(mod, "object", None) in copies:
+                mod.object = copies[mod.object]
+        for con in copy.constraints:
+            if getattr(con, "target", None) in copies:
+                con.target = copies[con.target]
+    return collection
@@ -0,0 +1,14 @@
+import bpy
+
+from blenderset.utils.library import cached_datablock
+
+
+def cached_material(key, create):
+    """
+        Returns a shared material for `key`, which should be a tuple of
+        everything that affects the material, such as texture paths and
+        shader parameters. The material is only created by calling `create()`
+        the first time a key is seen in the current blend file, so objects
+        using the same textures share one material and one compiled shader.
+    """
+    return cached_datablock(bpy.data.materials, key, create)
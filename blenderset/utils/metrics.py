@@ -0,0 +1,36 @@
+import cv2
+import numpy as np
+
+
+def to_display(img):
+    "Map a linear HDR image to [0, 1] with a plain 2.2 gamma, for comparisons."
+    return np.clip(img, 0, 1) ** (1 / 2.2)
+
+
+def psnr(img, reference):
+    "Peak signal to noise ratio in dB between two images with values in [0, 1]."
+    mse = np.mean((np.asarray(img, np.float64) - np.asarray(reference, np.float64)) ** 2)
+    if mse == 0:
+        return float("inf")
+    return float(10 * np.log10(1 / mse))
+
+
+def ssim(img, reference):
+    """
+        Mean structural similarity between two images with values in [0, 1],
+        using the usual 11x11 gaussian window with sigma 1.5, averaged over
+        the color channels.
+    """
+    img = np.asarray(img, np.float64)
+    reference = np.asarray(reference, np.float64)
+    c1, c2 = 0.01 ** 2, 0.03 ** 2
+
+    def blur(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+
+    mu1, mu2 = blur(img), blur(reference)
+    var1 = blur(img * img) - mu1 ** 2
+    var2 = blur(reference * reference) - mu2 ** 2
+    cov = blur(img * reference) - mu1 * mu2
+    ssim_map = ((2 * mu1 * mu2 + c1) * (2 * cov + c2)) / ((mu1 ** 2 + mu2 ** 2 + c1) * (var1 + var2 + c2))
+    return float(ssim_map.mean())
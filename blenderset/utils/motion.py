@@ -0,0 +1,63 @@
+import functools
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def convert_motion_sequence(fn, out_dir):
+    """
+        Unpack the (possibly compressed) npz archive `fn` into one uncompressed
+        .npy file per array in `out_dir`, which can then be memory mapped. The
+        conversion is written to a temporary directory and renamed into place
+        to be safe when several processes share the same cache.
+    """
+    out_dir = Path(out_dir)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=out_dir.name + ".", dir=out_dir.parent))
+    try:
+        with np.load(fn) as anim:
+            for k in anim.keys():
+                np.save(tmp_dir / (k + ".npy"), anim[k])
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    try:
+        tmp_dir.rename(out_dir)
+    except OSError:
+        # Another process finished the same conversion first
+        for p in tmp_dir.iterdir():
+            p.unlink()
+        tmp_dir.rmdir()
+
+
+@functools.lru_cache(maxsize=64)
+def load_motion_sequence(fn, out_dir):
+    """
+        Returns the arrays of the motion sequence npz file `fn` as a dict of
+        read-only memory mapped arrays, converting it into `out_dir` on first
+        use. Slicing the result only reads the selected frames from disk.
+        Recently used sequences are kept open in an LRU cache. If `out_dir`
+        can't be written, e.g. on a read-only assets mount, the arrays are
+        loaded from `fn` into memory instead.
+    """
+    fn, out_dir = Path(fn), Path(out_dir)
+    if not out_dir.exists():
+        try:
+            convert_motion_sequence(fn, out_dir)
+        except OSError as e:
+            logger.warning("Can't cache %s in %s (%s), loading it uncached", fn, out_dir, e)
+            with np.load(fn) as anim:
+                return {k: anim[k] for k in anim.keys()}
+    data = {}
+    for p in out_dir.glob("*.npy"):
+        try:
+            data[p.stem] = np.load(p, mmap_mode="r")
+        except ValueError:
+            # Arrays of python objects can't be memory mapped
+            data[p.stem] = np.load(p, allow_pickle=True)
+    return data
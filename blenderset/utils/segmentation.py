@@ -0,0 +1,63 @@
+import gzip
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+def encode_instances(segmentation, objects):
+    """
+        Remap the cryptomatte `segmentation`, with one 32 bit hash per pixel,
+        to dense instance indices. Pixel of the i:th object of `objects`, as
+        ordered in objects.json, get the index i + 1 and all other pixels 0.
+        The result is uint8 if there are fewer than 256 objects, uint16
+        otherwise. Returns the instance image and a dict mapping each
+        `segmentation_id` to its index.
+    """
+    ids = np.array([obj["segmentation_id"] for obj in objects.values()], np.uint32)
+    assert len(ids) < 2 ** 16
+    dtype = np.uint8 if len(ids) < 2 ** 8 else np.uint16
+    table = {int(sid): i + 1 for i, sid in enumerate(ids)}
+    if len(ids) == 0:
+        return np.zeros(segmentation.shape, dtype), table
+    order = np.argsort(ids)
+    sorted_ids = ids[order]
+    pos = np.minimum(np.searchsorted(sorted_ids, segmentation), len(ids) - 1)
+    instances = np.where(sorted_ids[pos] == segmentation, order[pos] + 1, 0)
+    return instances.astype(dtype), table
+
+
+def save_instances(out, segmentation, objects):
+    """
+        Save the cryptomatte `segmentation` as an instance image in
+        `out / "segmentations.npy.gz"` and the table mapping segmentation ids
+        to instance indices in `out / "segmentations.json"`. The index of
+        each object is also stored as its "instance_id".
+    """
+    out = Path(out)
+    instances, table = encode_instances(segmentation, objects)
+    for obj in objects.values():
+        obj["instance_id"] = table[obj["segmentation_id"]]
+    with gzip.GzipFile(out / "segmentations.npy.gz", "w") as fd:
+        np.save(fd, instances)
+    with (out / "segmentations.json").open("w") as fd:
+        json.dump(dict(format="instance", ids={str(k): v for k, v in table.items()}), fd)
+
+
+def load_instances(path):
+    """
+        Load the instance image of the render directory `path`, where pixels
+        of the i:th object in objects.json are i + 1 and all others 0. Older
+        renders, with cryptomatte hashes in segmentations.npy(.gz), are
+        remapped using the segmentation ids in objects.json.
+    """
+    path = Path(path)
+    if (path / "segmentations.npy").exists():
+        segmentation = np.load(path / "segmentations.npy")
+    else:
+        with gzip.GzipFile(path / "segmentations.npy.gz", "r") as fd:
+            segmentation = np.load(fd)
+    if (path / "segmentations.json").exists():
+        return segmentation
+    objects = json.loads((path / "objects.json").read_text())
+    return encode_instances(segmentation, objects)[0]
@@ -1,4 +1,9 @@
+from collections import defaultdict
+
+
 def get_all_tags(collection):
+    if isinstance(collection, TagIndex):
+        return set(collection.bits.keys())
     tags = set()
     for entry in collection.values():
         for tag in entry["tags"]:
@@ -6,7 +11,72 @@ def get_all_tags(collection):
     return tags
 
 
+def normalize_tags(tags):
+    "Convert a tag query into a hashable, order independent tuple."
+    if tags is None:
+        return None
+    if isinstance(tags, str):
+        tags = [tags]
+    return tuple(sorted(set(tags)))
+
+
+class TagIndex:
+    """
+        Inverted index over the tags of a `collection` mapping names to
+        entries with a "tags" list. Each tag is mapped to a bitset (stored as
+        a python int) with one bit per entry, which turns include queries
+        into intersections and exclude queries (`~tag`) into differences.
+        Query results are cached by their normalized tag tuple and shared
+        between callers, so they must be treated as read-only.
+    """
+    def __init__(self, collection):
+        self.collection = collection
+        self.names = list(collection.keys())
+        self.all = (1 << len(self.names)) - 1
+        self.bits = defaultdict(int)
+        for i, entry in enumerate(collection.values()):
+            for tag in entry["tags"]:
+                self.bits[tag] |= 1 << i
+        self.bits = dict(self.bits)
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def query(self, tags):
+        "Returns the bitset of the entries matching `tags`."
+        mask = self.all
+        for t in normalize_tags(tags):
+            if t[0] == "~":
+                mask &= ~self.bits.get(t[1:], 0)
+            else:
+                mask &= self.bits.get(t, 0)
+            if not mask:
+                break
+        return mask
+
+    def filter(self, tags):
+        key = normalize_tags(tags)
+        if key is None:
+            return self.collection
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        mask = self.query(key)
+        filtered = {}
+        while mask:
+            low = mask & -mask
+            name = self.names[low.bit_length() - 1]
+            filtered[name] = self.collection[name]
+            mask ^= low
+        self.cache[key] = filtered
+        return filtered
+
+
 def filter_by_tags(collection, tags):
+    if isinstance(collection, TagIndex):
+        return collection.filter(tags)
     if tags is None:
         return collection
     if isinstance(tags, str):
@@ -0,0 +1,18 @@
+import os
+import shutil
+
+# Temporary files handed over to Blender are placed in RAM when possible
+RAM_TEMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def temp_dir_for(size):
+    """
+        The directory to create temporary files totalling `size` bytes in, to
+        be passed as `dir` to the functions of the tempfile module. That is
+        `RAM_TEMP_DIR` if it has room for twice that, and otherwise None,
+        i.e. the default disk backed temporary directory. In docker and
+        kubernetes /dev/shm is only 64 MB by default.
+    """
+    if RAM_TEMP_DIR is not None and shutil.disk_usage(RAM_TEMP_DIR).free >= 2 * size:
+        return RAM_TEMP_DIR
+    return None
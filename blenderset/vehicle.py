@@ -1,9 +1,16 @@
 import random
+from collections import defaultdict
 
 from pathlib import Path
 from blenderset.utils import mesh
 import bpy
 from blenderset.assets import AssetGenerationFailed, AssetGenerator
+from blenderset.utils.library import (
+    append_collection,
+    append_material,
+    cached_datablock,
+    instance_collection,
+)
 from blenderset.utils.tags import filter_by_tags
 
 
@@ -44,6 +51,73 @@ class VehiclePanel(bpy.types.Panel):
         op = self.layout.operator("blenderset.vehicle_update", text="Update")
 
 
+class PathOccupancy:
+    """
+        Keeps track of the parts of each lane that are occupied by vehicles
+        as intervals of arc length, and samples vehicle positions uniformly
+        from the free parts. A lane is identified by any hashable key, e.g.
+        the name of a path and a lateral offset.
+    """
+    def __init__(self, margin=1.0):
+        self.margin = margin
+        self.occupied = defaultdict(dict)  # lane -> {name: (start, end)}
+
+    def release(self, name):
+        for intervals in self.occupied.values():
+            intervals.pop(name, None)
+
+    def occupy(self, name, lane, center, length):
+        self.release(name)
+        half = (length + self.margin) / 2
+        self.occupied[lane][name] = (center - half, center + half)
+
+    def free_intervals(self, lane, domain, length):
+        """
+            Returns the intervals within `domain` where the center of a
+            vehicle of `length` can be placed without overlapping others.
+        """
+        lo, hi = domain
+        half = (length + self.margin) / 2
+        free = []
+        for start, end in sorted(self.occupied[lane].values()):
+            if start - half > lo:
+                free.append((lo, min(start - half, hi)))
+            lo = max(lo, end + half)
+            if lo >= hi:
+                break
+        if lo < hi:
+            free.append((lo, hi))
+        return free
+
+    def sample(self, domains, length):
+        """
+            Returns a random `(lane, center)` among the free positions of the
+            lanes in `domains`, a dict mapping lanes to their (start, end)
+            arc length, or None if there is no room left.
+        """
+        candidates = [
+            (lane, start, end)
+            for lane, domain in domains.items()
+            for start, end in self.free_intervals(lane, domain, length)
+        ]
+        total = sum(end - start for _, start, end in candidates)
+        if total <= 0:
+            return None
+        r = random.uniform(0, total)
+        for lane, start, end in candidates:
+            if r <= end - start:
+                return lane, start + r
+            r -= end - start
+        lane, start, end = candidates[-1]
+        return lane, end
+
+
+def path_length(path):
+    "Arc length of the curve object `path` in world units."
+    scale = max(path.matrix_world.to_scale())
+    return scale * sum(spline.calc_length() for spline in path.data.splines)
+
+
 class GenerateVehicleAlongPath(AssetGenerator):
     def __init__(
         self,
@@ -60,8 +134,21 @@ class GenerateVehicleAlongPath(AssetGenerator):
         super().__init__(context)
         self.nbr_of_vehicles = nbr_of_vehicles
         self.root = self.root / "Tranportation_data"
+        model_data = self.catalog.tag_index(
+            ("vehicles", self.root, lowpoly), lambda: self.load_model_data(lowpoly)
+        )
+        self.model_data = filter_by_tags(model_data, tags)
+        self.colors = self.catalog.glob(self.root, "materials/*/*/*.blend")
+        self.path_names = paths
+        self.delta_x_offsets = delta_x_offsets
+        self.delta_x_offset_range = delta_x_offset_range
+        self.mirror = mirror
+        self.offset_range = offset_range
+        self.occupancy = PathOccupancy()
+
+    def load_model_data(self, lowpoly):
         model_data = {}
-        for fn in self.root.glob("vehicles/*/*/*.blend"):
+        for fn in self.catalog.glob(self.root, "vehicles/*/*/*.blend"):
             if ("lowpoly" in fn.name) != lowpoly:
                 continue
             model_data[fn] = {
@@ -71,23 +158,17 @@ class GenerateVehicleAlongPath(AssetGenerator):
                     "type:" + fn.parent.parent.name,
                 ],
             }
-        self.model_data = filter_by_tags(model_data, tags)
-        self.colors = list(self.root.glob("materials/*/*/*.blend"))
-        self.path_names = paths
-        self.delta_x_offsets = delta_x_offsets
-        self.delta_x_offset_range = delta_x_offset_range
-        self.mirror = mirror
-        self.offset_range = offset_range
+        return model_data
 
     def create(self):
         for _ in range(self.nbr_of_vehicles):
             vehicle = random.choice(list(self.model_data.values()))
-            with bpy.data.libraries.load(str(vehicle["blend"]), link=False) as (
-                data_src,
-                data_dst,
-            ):
-                data_dst.collections = data_src.collections
-            collection = data_dst.collections[0]
+            template = cached_datablock(
+                bpy.data.collections,
+                ("vehicle", str(vehicle["blend"])),
+                lambda: append_collection(vehicle["blend"]),
+            )
+            collection = instance_collection(template)
             self.context.scene.collection.children.link(collection)
             obj = collection.objects[0]
             while obj.parent is not None:
@@ -103,15 +184,19 @@ class GenerateVehicleAlongPath(AssetGenerator):
 
     def update_object(self, obj):
         color = random.choice(self.colors)
-        with bpy.data.libraries.load(str(color), link=False) as (data_src, data_dst):
-            data_dst.materials = data_src.materials
-        material = data_dst.materials[0]
+        material = cached_datablock(
+            bpy.data.materials, ("vehicle_paint", str(color)), lambda: append_material(color)
+        )
         for o in obj.children_recursive:
-            if obj.active_material is None:
-                continue
-            name = obj.active_material.name.lower()
-            if "car" in name and "paint" in name:
-                o.active_material = material
+            # The mesh data is shared between vehicles of the same model, so
+            # the paint is assigned per object and not to the mesh
+            for slot, base in zip(o.material_slots, getattr(o.data, "materials", [])):
+                if base is None:
+                    continue
+                name = base.name.lower()
+                if "car" in name and "paint" in name:
+                    slot.link = "OBJECT"
+                    slot.material = material
 
         if self.path_names is None:
             paths = self.get_all_objects_of_class("vehicle_path")
@@ -121,16 +206,29 @@ class GenerateVehicleAlongPath(AssetGenerator):
 
         object_meshes, other_meshes = self.get_object_meshes(obj)
 
+        # Sample from the free parts of the lanes and only use the BVH
+        # intersection test to validate the result
+        lengths = {path.name: path_length(path) for path in paths}
+        domains = {
+            (path.name, dx): (self.offset_range[0] * lengths[path.name], self.offset_range[1] * lengths[path.name])
+            for path in paths
+            for dx in self.delta_x_offsets
+        }
+        vehicle_length = max(o.dimensions[1] for o in object_meshes)
+        self.occupancy.release(obj.name)
+
         for _ in range(1000):
-            obj.pose.bones["Root"].constraints["Follow Path"].target = random.choice(
-                paths
-            )
+            sample = self.occupancy.sample(domains, vehicle_length)
+            if sample is None:
+                break
+            (path_name, dx), center = sample
+            obj.pose.bones["Root"].constraints["Follow Path"].target = bpy.data.objects[
+                path_name
+            ]
             obj.pose.bones["Root"].constraints[
                 "Follow Path"
-            ].offset_factor = random.uniform(*self.offset_range)
-            obj.delta_location[0] = random.choice(
-                self.delta_x_offsets
-            ) + random.uniform(*self.delta_x_offset_range)
+            ].offset_factor = center / lengths[path_name]
+            obj.delta_location[0] = dx + random.uniform(*self.delta_x_offset_range)
 
             if not self.mirror or random.uniform(0, 1) < 0.5:
                 obj.pose.bones["Root"].constraints[
@@ -145,8 +243,8 @@ class GenerateVehicleAlongPath(AssetGenerator):
                 if o.name in self.bvh_tree_cache:
                     del self.bvh_tree_cache[o.name]
             if not mesh.intersects(object_meshes, other_meshes, self.bvh_tree_cache):
-                break
-        else:
-            raise AssetGenerationFailed(
-                f"Could not find non-overlapping position for vehicle '{obj.name}'"
-            )
+                self.occupancy.occupy(obj.name, (path_name, dx), center, vehicle_length)
+                return
+        raise AssetGenerationFailed(
+            f"Could not find non-overlapping position for vehicle '{obj.name}'"
+        )
@@ -8,6 +8,7 @@ import fire
 import numpy as np
 from skimage import measure, morphology
 from blenderset.utils.log import configure_logging
+from blenderset.utils.segmentation import load_instances
 
 logger = logging.getLogger(__name__)
 
@@ -21,23 +22,24 @@ def fix_many(*roots: Union[str, pathlib.Path]):
 
 def fix_one(root: Union[str, pathlib.Path]):
     root = pathlib.Path(root)
-    segment_img = np.load(root / "segmentations.npy")
-    segment2label = {v: i for i, v in enumerate(np.unique(segment_img))}
-
-    label_img = np.zeros_like(segment_img)
-    for v, i in segment2label.items():
-        mask_img = morphology.binary_opening(segment_img == v, np.ones((5,) * 2))
-        label_img[mask_img] = i
-
-    props = measure.regionprops(label_img)
-
     objects_path = root / "objects.json"
     objects = json.loads(objects_path.read_text())
 
-    for obj in objects.values():
-        bbox = props[segment2label[obj["segmentation_id"]] - 1].bbox
+    # Pixels of the i:th object are labeled i + 1, background 0
+    instance_img = load_instances(root)
+    label_img = np.zeros_like(instance_img)
+    for label in range(1, len(objects) + 1):
+        mask_img = morphology.binary_opening(instance_img == label, np.ones((5,) * 2))
+        label_img[mask_img] = label
+
+    props = {p.label: p for p in measure.regionprops(label_img)}
+
+    for label, obj in enumerate(objects.values(), 1):
+        if label not in props:
+            continue
+        bbox = props[label].bbox
         obj["bounding_box_tighter"] = bbox[1], bbox[3], bbox[0], bbox[2]
-    objects_path.write_text(dumps(objects))
+    objects_path.write_text(json.dumps(objects))
 
 
 if __name__ == "__main__":
@@ -12,9 +12,11 @@ from typing import Generic, TypeVar
 
 import math
 import more_itertools
+import numpy as np
 
 import bpy
-from blenderset.render import PreviewRenderer, Renderer
+from blenderset.camera import get_current_camera
+from blenderset.render import AnnotationRenderer, PreviewRenderer, Renderer
 from blenderset.scenarios import Nyhamnen, DelfinenSynthBack, DelfinenRealBack
 
 num_scene = 100
@@ -140,6 +142,68 @@ def should_render_final(preview_path: pathlib.Path):
     return any(l.intersection(r) for l, r in more_itertools.pairwise(rectangles))
 
 
+def world_vertices(obj) -> np.ndarray:
+    """Return the evaluated vertices of the meshes of `obj` and its children in world
+    coordinates, as homogeneous coordinates"""
+    dg = bpy.context.evaluated_depsgraph_get()
+    vertices = [np.zeros((0, 4))]
+    for o in [obj] + list(obj.children_recursive):
+        if o.type != "MESH":
+            continue
+        evaluated = o.evaluated_get(dg)
+        mesh = evaluated.to_mesh()
+        local = np.empty(len(mesh.vertices) * 3, np.float32)
+        mesh.vertices.foreach_get("co", local)
+        evaluated.to_mesh_clear()
+        local = np.hstack([local.reshape(-1, 3), np.ones((len(local) // 3, 1))])
+        vertices.append(local @ np.array(evaluated.matrix_world).T)
+    return np.vstack(vertices)
+
+
+def projected_rectangle(obj, camera_matrix, lens) -> Rectangle | None:
+    """Return the image space bounding box of the projected vertices of the meshes of
+    `obj`, or None if it is not in front of the camera
+
+    The vertices are projected instead of the corners of the 3D bounding box, since with
+    a distorted lens, e.g. a fisheye, the projected box edges curve and the object can
+    extend beyond the projected corners. Objects partly behind the camera get the
+    entire image.
+    """
+    points = world_vertices(obj) @ camera_matrix.T
+    in_front = points[:, 2] < 0  # The camera looks along -z
+    if not in_front.any():
+        return None
+    height = bpy.context.scene.render.resolution_y
+    width = bpy.context.scene.render.resolution_x
+    if not in_front.all():
+        return Rectangle.from_ltrb(0.0, 0.0, float(width - 1), float(height - 1))
+    uv = lens.world_to_image(points[:, :3])
+    left, top = np.maximum(uv.min(axis=0), 0)
+    right, bottom = np.minimum(uv.max(axis=0), (width - 1, height - 1))
+    if left >= right or top >= bottom:
+        return None
+    return Rectangle.from_ltrb(float(left), float(top), float(right), float(bottom))
+
+
+def predict_overlap() -> bool:
+    """Return True if the projected bounding boxes of any two humans or cars overlap
+
+    This only looks at the geometry and does not render anything. It should never
+    reject a permutation that `should_render_final` would accept, but can accept
+    permutations where only the loose boxes overlap, e.g. because of occlusion, so
+    accepted permutations are confirmed with an annotation render.
+    """
+    camera_matrix, lens = get_current_camera()
+    rectangles = []
+    for obj in bpy.context.scene.objects:
+        if obj.get("blenderset.object_class") not in {"car", "human"}:
+            continue
+        rectangle = projected_rectangle(obj, camera_matrix, lens)
+        if rectangle is not None:
+            rectangles.append(rectangle)
+    return any(l.intersection(r) for l, r in itertools.combinations(rectangles, 2))
+
+
 def main(name: str):
     clss = {
         "DelfinenSynthBack": DelfinenSynthBack,
@@ -155,9 +219,14 @@ def main(name: str):
     root = roots[name]
     cls = clss[name]
 
-    preview_renderer = PreviewRenderer(bpy.context, root)
     final_renderer = Renderer(bpy.context, root)
     preview_only = os.environ.get("BLENDERSET_PREVIEW", "0") == "1"
+    # Confirm the geometric overlap prediction with a render of the annotations only,
+    # or with a preview render if that is to be kept
+    if preview_only:
+        confirm_renderer = PreviewRenderer(bpy.context, root)
+    else:
+        confirm_renderer = AnnotationRenderer(bpy.context, root)
 
     for scene_num in range(num_scene):
         bpy.ops.wm.open_mainfile(filepath="blank.blend")
@@ -170,13 +239,16 @@ def main(name: str):
             attempt_num = next(attempt_nums)
             stem = f"{run_name}_{scene_num:03}_{perm_num:03}_{attempt_num:04}"
             name = f"{stem}"
-            path = preview_renderer.render(name)
+            if not predict_overlap():
+                gen.update()
+                continue
+            path = confirm_renderer.render(gen, name)
             if should_render_final(path):
                 perm_num += 1
                 if preview_only:
                     path.rename(path.with_suffix(".preview"))
                 else:
-                    final_renderer.render(path.with_suffix(".final").name)
+                    final_renderer.render(gen, path.with_suffix(".final").name)
 
             if not preview_only and path.exists():
                 shutil.rmtree(path)
@@ -15,13 +15,14 @@ np.set_printoptions(threshold=np.inf)
 
 import bpy
 
-from blenderset.render import PreviewRenderer, Renderer
+from blenderset.render import AnnotationRenderer, PreviewRenderer, Renderer
 from blenderset.scenarios import (
     Nyhamnen,
     RealHighway,
     ProjectiveSyntheticPedestrians,
 )
 from blenderset.bedlam import SoccerScene, SoccerSceneInPlay
+from blenderset.pool import get_object_pool
 
 
 def main():
@@ -32,7 +33,16 @@ def main():
     root = Path("renders/SoccerCrowd")
 
     # renderer = PreviewRenderer(bpy.context, root, save_blend=True, save_exr=True)
-    renderer = Renderer(bpy.context, root)
+    # renderer = AnnotationRenderer(bpy.context, root)  # Only objects.json, segmentations and depth
+    # Keep the scene synchronized in Cycles between the permutations
+    persistent_data = os.environ.get("BLENDERSET_PERSISTENT_DATA", "0") == "1"
+    # One of the quality profiles of blenderset.render, e.g. picked by tune_quality.py
+    quality = os.environ.get("BLENDERSET_QUALITY")
+    renderer = Renderer(bpy.context, root, persistent_data=persistent_data, quality=quality)
+    # float32, float16, uint16_mm or log_uint16, see blenderset.utils.depth
+    renderer.depth_format = os.environ.get("BLENDERSET_DEPTH_FORMAT", "float32")
+    # Bake the permutations onto frames and render them in one call
+    bake_permutations = os.environ.get("BLENDERSET_BAKE_PERMUTATIONS", "0") == "1"
 
     render_lock = FileLock("/tmp/blenderset_render.lock")
     run_start = datetime.datetime.now()
@@ -43,13 +53,22 @@ def main():
         run_name += '_' + os.environ['SLURM_JOBID']
     run_name += "_" + str(os.getpid())
     # run_name = "20231218_135454_hapad"
+    # Keep the blend file between scenes and reuse characters from the object
+    # pool. Only the CC3 characters of GenerateCharacter are pooled, and
+    # scenarios using GeneratePremadeBackground, like SoccerScene, open a blend
+    # file themselves and empty the pool. So this currently only helps
+    # scenarios such as Nyhamnen or ProjectiveSyntheticPedestrians.
+    reuse_scene = os.environ.get("BLENDERSET_REUSE_SCENE", "0") == "1"
     random.seed(run_name)
     np.random.seed(random.randrange(0, 2 ** 32))
 
     timeing = []
     for scene_num in range(1000):
         t0 = time()
-        bpy.ops.wm.open_mainfile(filepath="blank.blend")
+        if reuse_scene and scene_num > 0:
+            get_object_pool().reset_scene(bpy.context)
+        else:
+            bpy.ops.wm.open_mainfile(filepath="blank.blend")
         # gen = Nyhamnen(bpy.context, 3) #randint(20, 200), test_set=True)
         # gen = RealHighway(bpy.context, randint(20, 30))
         # gen = ProjectiveSyntheticPedestrians(bpy.context)
@@ -58,6 +77,14 @@ def main():
         t1 = time()
         gen.create()
         t2 = time()
+        if bake_permutations:
+            with render_lock:
+                renderer.render_permutations(
+                    gen, [f"{run_name}_{scene_num:03}_{perm_num:03}" for perm_num in range(10)]
+                )
+            timeing.append([t1-t0, t2-t1, time()-t2])
+            print('Timing', timeing)
+            continue
         for perm_num in range(10):
             with render_lock:
                 renderer.render_all_cameras(gen, f"{run_name}_{scene_num:03}_{perm_num:03}")
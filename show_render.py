@@ -5,17 +5,17 @@ import json
 import logging
 import pathlib
 from typing import Union
-import gzip
 
 import cv2
 import fire
 import numpy as np
 from blenderset.utils.log import configure_logging
-from skimage import util
 from vi3o import debugview
 from vi3o.image import imread, ptpscale
 
+from blenderset.utils.depth import load_depth
 from blenderset.utils.lens import create_lens_from_json
+from blenderset.utils.segmentation import load_instances
 
 logger = logging.getLogger(__name__)
 
@@ -61,12 +61,7 @@ class DebugViewer(debugview.DebugViewer):
 
 @functools.lru_cache(maxsize=2)
 def _read_seg(path: pathlib.Path):
-    if (path / "segmentations.npy").exists():
-        segmentations = np.load(path / "segmentations.npy")
-    else:
-        with gzip.GzipFile(path / "segmentations.npy.gz", "r") as fd:
-            segmentations = np.load(fd)
-    return util.img_as_ubyte(segmentations)
+    return ptpscale(load_instances(path))
 
 @functools.lru_cache(maxsize=2)
 def _read_hmask(path: pathlib.Path):
@@ -74,11 +69,7 @@ def _read_hmask(path: pathlib.Path):
 
 @functools.lru_cache(maxsize=2)
 def _read_depth(path: pathlib.Path):
-    if (path / "depth.npy").exists():
-        depth = np.load(path / "depth.npy")
-    else:
-        with gzip.GzipFile(path / "depth.npy.gz", "r") as fd:
-            depth = np.load(fd)
+    depth = load_depth(path)
     depth[depth>50] = 50
     return ptpscale(depth)
 
@@ -0,0 +1,79 @@
+"""
+    Picks the cheapest render quality profile that is good enough. A fixed
+    scene is rendered on the CPU with a high quality reference profile and
+    then with each of the other profiles. The one with the shortest render
+    time whose PSNR against the reference reaches the target is selected.
+    The measurements are printed and saved as quality_tuning.json in the
+    output directory. Run with `make run-tune_quality`.
+
+    Environment variables:
+        BLENDERSET_TUNE_SCENARIO: Scenario class to render (default Nyhamnen)
+        BLENDERSET_TUNE_TARGET_PSNR: Required PSNR in dB (default 40)
+        BLENDERSET_TUNE_REFERENCE: Profile used as reference (default high)
+        BLENDERSET_TUNE_RESOLUTION: Resolution percentage (default 25)
+"""
+import json
+import os
+import random
+import sys
+from pathlib import Path
+
+import bpy
+import numpy as np
+
+from blenderset import scenarios
+from blenderset.render import Renderer, get_quality_profiles
+from blenderset.utils.exr import ExrFile
+from blenderset.utils.log import configure_logging
+from blenderset.utils.metrics import psnr, to_display
+
+root = Path("renders/quality_tuning")
+scenario = os.environ.get("BLENDERSET_TUNE_SCENARIO", "Nyhamnen")
+target_psnr = float(os.environ.get("BLENDERSET_TUNE_TARGET_PSNR", "40"))
+reference_profile = os.environ.get("BLENDERSET_TUNE_REFERENCE", "high")
+resolution = int(os.environ.get("BLENDERSET_TUNE_RESOLUTION", "25"))
+
+
+def render(gen, profile):
+    renderer = Renderer(bpy.context, root, save_exr=True, quality=profile)
+    renderer.device = "CPU"
+    out = renderer.render(gen, profile)
+    img = to_display(ExrFile(out / "layers.exr").get_rgb_image())
+    return renderer.render_time, img
+
+
+def main():
+    random.seed(42)
+    np.random.seed(42)
+    bpy.ops.wm.open_mainfile(filepath="blank.blend")
+    gen = getattr(scenarios, scenario)(bpy.context)
+    gen.create()
+    bpy.context.scene.render.resolution_percentage = resolution
+
+    reference_time, reference = render(gen, reference_profile)
+    report = dict(
+        scenario=scenario,
+        target_psnr=target_psnr,
+        reference=dict(profile=reference_profile, time=reference_time),
+        profiles={},
+    )
+    for profile in get_quality_profiles():
+        if profile == reference_profile:
+            continue
+        t, img = render(gen, profile)
+        report["profiles"][profile] = dict(time=t, psnr=psnr(img, reference))
+        print("Profile", profile, report["profiles"][profile])
+
+    good_enough = [p for p, r in report["profiles"].items() if r["psnr"] >= target_psnr]
+    report["selected"] = min(
+        good_enough, key=lambda p: report["profiles"][p]["time"], default=reference_profile
+    )
+    with open(root / "quality_tuning.json", "w") as fd:
+        json.dump(report, fd, indent=4)
+    json.dump(report, sys.stdout, indent=4)
+    print()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    main()